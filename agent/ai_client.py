@@ -1,62 +1,238 @@
 import asyncio
 import base64
-import json
+import email.utils
+import functools
 import logging
+import random
 import re
-from typing import Any, Dict, List, Optional, Tuple
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
 import httpx
+import orjson
+
+from agent.llm_cache import ResponseCache, cache_key
 
 
 logger = logging.getLogger("hn_agent.ai")
 
+_OFFLOAD_RESPONSE_BYTES = 256 * 1024
+_OFFLOAD_JSON_TEXT_CHARS = 64 * 1024
+
+_MAX_RETRY_AFTER_SECONDS = 120.0
+_BREAKER_THRESHOLD = 5
+_BREAKER_COOLDOWN_SECONDS = 10.0
+_JITTER = random.SystemRandom()
+
+_DATA_PREFIX = "data:"
+_HTTP_PREFIXES = ("http://", "https://")
+_PREVIEW_TABLE = str.maketrans({"\r": " ", "\n": " "})
+_JSON_OBJ_RE = re.compile(r"\{.*\}", re.DOTALL)
+_ARABIC_LETTER_RE = re.compile(r"[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]")
+_LATIN_LETTER_RE = re.compile(r"[A-Za-z]")
+
+# Static instructions go in the system message ahead of the per-call data so
+# that provider-side prompt caches, which match on identical prefixes, can hit.
+_TEMPLATE_PICK_RULES = (
+    "You are a LinkedIn copy chief. Select the best template from the provided list for the blog below. "
+    "Prefer Darija-first bilingual output.\n\n"
+    "Return ONLY valid JSON with keys: template_number (integer 1-9), template_name (string), reason_short (string).\n\n"
+)
+
+_DRAFT_RULES = (
+    "You write high-performing LinkedIn posts for Moroccan tech/cybersecurity. "
+    "Generate ONE bilingual LinkedIn post (primary Arabic Darija, short English secondary) based on the blog.\n\n"
+    "Rules:\n"
+    "- Do NOT include the URL in the post body. Put it in first_comment only.\n"
+    "- The post body should tease value and invite discussion.\n"
+    "- The first_comment must contain the link first on its own line, then the brand on a new line.\n"
+    "- Keep it human, punchy, and readable on LinkedIn.\n\n"
+    "- When writing in Darija, use Arabic letters (حروف عربية). Example: كاينة واحد الثغرة...\n"
+    "- Do NOT write Darija using Latin transliteration (Darija latine). Latin letters are allowed only for the short English part and for technical terms (CVE, MongoDB, npm, etc.).\n\n"
+    "Return ONLY valid JSON with keys:\n"
+    "chosen_template_number (int), post_text (string), first_comment (string), hashtags (array of strings).\n\n"
+)
+
+_BLOG_RULES = (
+    "You are a professional cybersecurity blog writer. "
+    "Write a complete long-form blog post in Markdown based on the source below. "
+    "Include: a strong headline, short TL;DR, sections with headings, and a conclusion. "
+    "Keep factual accuracy: do not invent details not present in the source. "
+    "If information is missing, state it clearly. "
+    "Add a 'Source' section with the original URL at the end.\n\n"
+)
+
+_MANGA_PROMPT_RULES = (
+    "You are a creative prompt engineer for manga/anime image generation.\n\n"
+    "Task: Convert a news blog article into 4 fully independent, colored manga image-generation prompts. "
+    "Each prompt corresponds to a manga page depicting the incident in a funny, exaggerated, manga/anime style, "
+    "with dialogue in Moroccan Darija.\n\n"
+    "Instructions:\n\n"
+    "1. Read the blog article carefully.\n"
+    "2. Generate 4 independent prompts (Page 1–4), each standalone:\n"
+    "   - Scene description:\n"
+    "     - Background\n"
+    "     - Characters (appearance, emotions, poses)\n"
+    "     - Key objects/metaphors (coins, malware, mnemonics, warning symbols)\n"
+    "     - Actions/comic exaggeration\n"
+    "   - Dialogue in Moroccan Darija:\n"
+    "     - Maximum 2 text blocks per page in Darija\n"
+    "     - English text allowed for names, logos, numbers, or technical terms\n"
+    "   - Visual style:\n"
+    "     - Manga/anime cyberpunk\n"
+    "     - Colored illustration\n"
+    "     - Strong black ink lines, sketchy/gritty textures\n"
+    "     - Color palette: dominant + accent colors (red for danger, neon for data, etc.)\n"
+    "     - Lighting, cinematic framing, focus\n"
+    "3. Main character rules:\n"
+    "   - If male, always wearing sportif outfit of MAS (Maghreb Association of Sport) of Fez\n"
+    "   - Maintain exaggerated facial expressions and gestures for humor\n"
+    "4. Each prompt must be self-contained; can be generated independently.\n"
+    "5. Output format: each prompt must be inside a fenced code block with language txt.\n\n"
+    "Page 1 Prompt:\n```txt\n...\n```\n"
+    "Page 2 Prompt:\n```txt\n...\n```\n"
+    "Page 3 Prompt:\n```txt\n...\n```\n"
+    "Page 4 Prompt:\n```txt\n...\n```\n\n"
+    "Requirements:\n\n"
+    "- Use metaphors for technical details: mnemonics, crypto theft, malware, backdoor, etc.\n"
+    "- Exaggerated expressions, humorous tone, but story clearly reflects the news incident.\n"
+    "- Colored manga only, no black-and-white.\n"
+    "- Ultra-detailed, cinematic composition, poster-quality illustration.\n\n"
+    "Input blog text:\n"
+)
+
+
+@functools.lru_cache(maxsize=4)
+def _template_pick_system_prompt(templates_text: str) -> str:
+    return f"{_TEMPLATE_PICK_RULES}TEMPLATES:\n{templates_text}\n"
+
+
+@functools.lru_cache(maxsize=4)
+def _draft_system_prompt(templates_text: str) -> str:
+    return f"{_DRAFT_RULES}TEMPLATES:\n{templates_text}\n"
+
+
+def _clip(text: str, limit: int) -> str:
+    # Cut on a word boundary so the model never sees a half word/token at the end.
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", limit // 2, limit)
+    return text[: cut if cut > 0 else limit]
+
+
+class AICircuitOpenError(RuntimeError):
+    pass
+
 
 class HackClubAIClient:
-    def __init__(self, base_url: str, api_key: str, timeout_seconds: float = 240.0, max_retries: int = 3) -> None:
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        timeout_seconds: float = 240.0,
+        max_retries: int = 3,
+        cache: Optional[ResponseCache] = None,
+        max_concurrency: int = 8,
+        http: Optional[httpx.AsyncClient] = None,
+        image_concurrency: int = 4,
+    ) -> None:
         self._base_url = base_url
         self._api_key = api_key
         self._max_retries = max_retries
+        self._cache = cache
+        self._sem = asyncio.Semaphore(max(1, max_concurrency))
+        # Image generation is the slowest and most rate-limited call; cap it separately
+        # so concurrent items cannot flood the image model.
+        self._image_sem = asyncio.Semaphore(max(1, image_concurrency))
+        self._consecutive_server_errors = 0
+        self._breaker_open_until = 0.0
+        # Retries are handled in chat() so they go through the semaphore and breaker.
+        # http2/limits must live on the transport when one is passed explicitly.
         self._client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60.0),
+                retries=0,
+            ),
             timeout=httpx.Timeout(timeout_seconds, connect=20.0),
             headers={
                 "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json",
             },
         )
+        # Image downloads go to arbitrary CDNs; reuse the caller's general-purpose pool
+        # when one is provided.
+        self._owns_image_client = http is None
+        self._image_client = http or httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=httpx.Limits(max_keepalive_connections=5, keepalive_expiry=15.0),
+            follow_redirects=True,
+        )
 
     async def close(self) -> None:
         await self._client.aclose()
+        if self._owns_image_client:
+            await self._image_client.aclose()
 
     @staticmethod
     def _preview(text: str, limit: int = 300) -> str:
-        t = (text or "").replace("\r", " ").replace("\n", " ").strip()
+        t = (text or "").translate(_PREVIEW_TABLE).strip()
         if len(t) <= limit:
             return t
         return t[:limit] + "..."
 
-    async def chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+    @staticmethod
+    def _is_cacheable(payload: Dict[str, Any]) -> bool:
+        # Only deterministic text completions are safe to replay; without an explicit
+        # temperature the provider samples at its own default, so nothing is cached.
+        if "image" in (payload.get("modalities") or []):
+            return False
+        temperature = payload.get("temperature")
+        return isinstance(temperature, (int, float)) and temperature <= 0
+
+    async def _forget(self, payload: Dict[str, Any]) -> None:
+        # Drops a cached reply the caller rejected, so the next attempt asks the model again.
+        if self._cache is not None and self._is_cacheable(payload):
+            await asyncio.to_thread(self._cache.delete, cache_key(payload))
+
+    async def chat(self, payload: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
+        key: Optional[str] = None
+        if use_cache and self._cache is not None and self._is_cacheable(payload):
+            key = cache_key(payload)
+            cached = await asyncio.to_thread(self._cache.get, key)
+            if cached is not None:
+                logger.info("ai_cache_hit model=%s", payload.get("model"))
+                return cached
+
+        body = orjson.dumps(payload)
         last_exc: Optional[BaseException] = None
 
         for attempt in range(self._max_retries + 1):
+            retry_after: Optional[float] = None
             try:
                 model = payload.get("model")
                 logger.info("running ai_request model=%s", model)
-                r = await self._client.post(self._base_url, json=payload)
+                self._check_breaker()
+                async with self._sem:
+                    r = await self._client.post(self._base_url, content=body)
+                    raw = r.content
                 status = r.status_code
+                self._record_status(status)
 
                 body_text = ""
                 try:
-                    data = r.json()
+                    if len(raw) > _OFFLOAD_RESPONSE_BYTES:
+                        data = await asyncio.to_thread(orjson.loads, raw)
+                    else:
+                        data = orjson.loads(raw)
                 except Exception:
                     data = None
-                    body_text = (r.text or "")
+                    body_text = raw.decode("utf-8", errors="replace")
 
                 if status >= 400:
-                    if not body_text:
-                        try:
-                            body_text = json.dumps(data, ensure_ascii=False)
-                        except Exception:
-                            body_text = ""
+                    if data is not None:
+                        body_text = orjson.dumps(data).decode("utf-8")
                     logger.error(
                         "response status: %s, message: %s",
                         status,
@@ -65,16 +241,22 @@ class HackClubAIClient:
                     r.raise_for_status()
 
                 if isinstance(data, dict):
-                    msg = self._extract_text(data)
-                    logger.info("response status: %s, message: %s", status, self._preview(msg))
+                    if logger.isEnabledFor(logging.INFO):
+                        msg = self._extract_text(data)
+                        logger.info("response status: %s, message: %s", status, self._preview(msg))
+                    if key is not None and self._cache is not None and self._extract_text(data).strip():
+                        await asyncio.to_thread(self._cache.set, key, data)
                     return data
 
-                logger.info("response status: %s, message: %s", status, self._preview(body_text))
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("response status: %s, message: %s", status, self._preview(body_text))
                 return {}
             except httpx.HTTPStatusError as e:
                 status = e.response.status_code if e.response is not None else None
                 if status == 429 or (isinstance(status, int) and 500 <= status < 600):
                     last_exc = e
+                    if status in (429, 503):
+                        retry_after = self._retry_after_seconds(e.response)
                 else:
                     raise
             except (httpx.TimeoutException, httpx.TransportError) as e:
@@ -84,9 +266,13 @@ class HackClubAIClient:
                 assert last_exc is not None
                 raise last_exc
 
-            wait_s = min(2 ** attempt, 30)
+            if retry_after is not None:
+                wait_s = min(retry_after, _MAX_RETRY_AFTER_SECONDS)
+            else:
+                # Full-range jitter keeps concurrent callers from retrying in lockstep.
+                wait_s = min(2 ** attempt, 30) * (0.5 + _JITTER.random())
             logger.warning(
-                "ai_retry attempt=%s/%s wait_s=%s error=%s",
+                "ai_retry attempt=%s/%s wait_s=%.2f error=%s",
                 attempt + 1,
                 self._max_retries,
                 wait_s,
@@ -94,44 +280,155 @@ class HackClubAIClient:
             )
             await asyncio.sleep(wait_s)
 
+    async def chat_stream(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        # Yields text deltas as the model produces them (OpenAI-style SSE). Cache hits are
+        # yielded whole, and a request that fails before its first delta falls back to
+        # chat() with its retries; a partially consumed stream cannot be replayed. A
+        # completed response is never re-requested, even if it carried no text.
+        key: Optional[str] = None
+        if self._cache is not None and self._is_cacheable(payload):
+            key = cache_key(payload)
+            cached = await asyncio.to_thread(self._cache.get, key)
+            if cached is not None:
+                logger.info("ai_cache_hit model=%s", payload.get("model"))
+                yield self._extract_text(cached)
+                return
+
+        parts: List[str] = []
+        whole: Optional[Dict[str, Any]] = None
+        failed = False
+        try:
+            self._check_breaker()
+            async with self._sem:
+                logger.info("running ai_stream model=%s", payload.get("model"))
+                body = orjson.dumps({**payload, "stream": True})
+                async with self._client.stream("POST", self._base_url, content=body) as r:
+                    self._record_status(r.status_code)
+                    if r.status_code >= 400:
+                        await r.aread()
+                        r.raise_for_status()
+                    if "text/event-stream" not in (r.headers.get("content-type") or ""):
+                        # The endpoint ignored stream=True and sent an ordinary completion.
+                        raw = await r.aread()
+                        try:
+                            data = orjson.loads(raw)
+                        except orjson.JSONDecodeError:
+                            data = None
+                        whole = data if isinstance(data, dict) else {}
+                    else:
+                        async for line in r.aiter_lines():
+                            delta = self._sse_delta(line)
+                            if delta:
+                                parts.append(delta)
+                                yield delta
+        except (httpx.HTTPStatusError, httpx.TimeoutException, httpx.TransportError) as e:
+            if parts:
+                raise
+            logger.warning("ai_stream_fallback error=%s", type(e).__name__)
+            failed = True
+
+        if failed:
+            resp = await self.chat(payload)
+            yield self._extract_text(resp)
+            return
+
+        if whole is not None:
+            text = self._extract_text(whole)
+            if text:
+                yield text
+                if key is not None and self._cache is not None:
+                    await asyncio.to_thread(self._cache.set, key, whole)
+            return
+
+        if parts and key is not None and self._cache is not None:
+            reply = {"choices": [{"message": {"role": "assistant", "content": "".join(parts)}}]}
+            await asyncio.to_thread(self._cache.set, key, reply)
+
     @staticmethod
-    def _extract_text(resp: Dict[str, Any]) -> str:
+    def _sse_delta(line: str) -> str:
+        if not line.startswith("data:"):
+            return ""
+        data = line[5:].strip()
+        if not data or data == "[DONE]":
+            return ""
+        try:
+            event = orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return ""
+        choices = event.get("choices") if isinstance(event, dict) else None
+        if not isinstance(choices, list) or not choices or not isinstance(choices[0], dict):
+            return ""
+        delta = choices[0].get("delta")
+        content = delta.get("content") if isinstance(delta, dict) else None
+        return content if isinstance(content, str) else ""
+
+    def _check_breaker(self) -> None:
+        if time.monotonic() < self._breaker_open_until:
+            raise AICircuitOpenError("AI endpoint circuit breaker is open")
+
+    def _record_status(self, status: int) -> None:
+        if 500 <= status < 600:
+            self._consecutive_server_errors += 1
+            if self._consecutive_server_errors >= _BREAKER_THRESHOLD:
+                self._breaker_open_until = time.monotonic() + _BREAKER_COOLDOWN_SECONDS
+                self._consecutive_server_errors = 0
+                logger.warning("ai_circuit_open cooldown_s=%s", _BREAKER_COOLDOWN_SECONDS)
+        else:
+            self._consecutive_server_errors = 0
+
+    @staticmethod
+    def _retry_after_seconds(response: Optional[httpx.Response]) -> Optional[float]:
+        raw = (response.headers.get("Retry-After") if response is not None else None) or ""
+        raw = raw.strip()
+        if not raw:
+            return None
+        try:
+            return max(0.0, float(raw))
+        except ValueError:
+            pass
+        try:
+            when = email.utils.parsedate_to_datetime(raw)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+    @staticmethod
+    def _first_message(resp: Dict[str, Any]) -> Dict[str, Any]:
         choices = resp.get("choices")
-        if isinstance(choices, list) and choices:
-            msg = (choices[0] or {}).get("message") or {}
-            content = msg.get("content")
-            if isinstance(content, str):
-                return content
-            if isinstance(content, list):
-                parts: List[str] = []
-                for p in content:
-                    if not isinstance(p, dict):
-                        continue
-                    if p.get("type") == "text" and isinstance(p.get("text"), str):
-                        parts.append(p["text"])
-                return "\n".join(parts).strip()
+        if not isinstance(choices, list) or not choices:
+            return {}
+        msg = (choices[0] or {}).get("message")
+        return msg if isinstance(msg, dict) else {}
+
+    @staticmethod
+    def _extract_text(resp: Dict[str, Any]) -> str:
+        content = HackClubAIClient._first_message(resp).get("content")
+        if isinstance(content, str):
+            return content
+        if isinstance(content, list):
+            return "\n".join(
+                p["text"] for p in content if isinstance(p, dict) and p.get("type") == "text" and isinstance(p.get("text"), str)
+            ).strip()
         return ""
 
     @staticmethod
     def _count_arabic_and_latin_letters(text: str) -> Tuple[int, int]:
         t = text or ""
-        arabic = re.findall(r"[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]", t)
-        latin = re.findall(r"[A-Za-z]", t)
+        arabic = _ARABIC_LETTER_RE.findall(t)
+        latin = _LATIN_LETTER_RE.findall(t)
         return len(arabic), len(latin)
 
-    async def generate_blog_markdown(self, model: str, source: Dict[str, Any]) -> str:
+    @staticmethod
+    def _blog_payload(model: str, source: Dict[str, Any]) -> Dict[str, Any]:
         title = source.get("title") or ""
         url = source.get("url") or ""
         summary = source.get("description") or ""
         text = source.get("article", {}).get("text") or ""
 
         prompt = (
-            "You are a professional cybersecurity blog writer. "
-            "Write a complete long-form blog post in Markdown based on the source below. "
-            "Include: a strong headline, short TL;DR, sections with headings, and a conclusion. "
-            "Keep factual accuracy: do not invent details not present in the source. "
-            "If information is missing, state it clearly. "
-            "Add a 'Source' section with the original URL at the end.\n\n"
+            f"{_BLOG_RULES}"
             f"SOURCE_TITLE: {title}\n"
             f"SOURCE_URL: {url}\n"
             f"SOURCE_SUMMARY: {summary}\n\n"
@@ -139,14 +436,18 @@ class HackClubAIClient:
             f"{text}\n"
         )
 
-        resp = await self.chat(
-            {
-                "model": model,
-                "messages": [{"role": "user", "content": prompt}],
-            }
-        )
+        return {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+
+    async def generate_blog_markdown(self, model: str, source: Dict[str, Any]) -> str:
+        resp = await self.chat(self._blog_payload(model, source))
         return self._extract_text(resp).strip()
 
+    def stream_blog_markdown(self, model: str, source: Dict[str, Any]) -> AsyncIterator[str]:
+        return self.chat_stream(self._blog_payload(model, source))
+
     @staticmethod
     def _extract_json_from_text(text: str) -> Dict[str, Any]:
         raw = (text or "").strip()
@@ -154,55 +455,98 @@ class HackClubAIClient:
             return {}
 
         try:
-            obj = json.loads(raw)
+            obj = orjson.loads(raw)
             if isinstance(obj, dict):
                 return obj
         except Exception:
             pass
 
-        m = re.search(r"\{.*\}", raw, flags=re.DOTALL)
+        candidate = HackClubAIClient._find_json_object(raw)
+        if candidate is not None:
+            try:
+                obj = orjson.loads(candidate)
+                if isinstance(obj, dict):
+                    return obj
+            except Exception:
+                pass
+
+        m = _JSON_OBJ_RE.search(raw)
         if not m:
             return {}
         try:
-            obj = json.loads(m.group(0))
+            obj = orjson.loads(m.group(0))
             return obj if isinstance(obj, dict) else {}
         except Exception:
             return {}
 
+    async def _parse_json_text(self, text: str) -> Dict[str, Any]:
+        # Large outputs are parsed off the event loop so concurrent AI calls keep flowing.
+        if len(text or "") > _OFFLOAD_JSON_TEXT_CHARS:
+            return await asyncio.to_thread(self._extract_json_from_text, text)
+        return self._extract_json_from_text(text)
+
+    @staticmethod
+    def _find_json_object(raw: str) -> Optional[str]:
+        # Single linear pass for the first balanced {...} span, skipping braces
+        # inside string literals.
+        depth = 0
+        start = -1
+        in_string = False
+        escaped = False
+        for i, ch in enumerate(raw):
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                if depth:
+                    in_string = True
+            elif ch == "{":
+                if depth == 0:
+                    start = i
+                depth += 1
+            elif ch == "}" and depth:
+                depth -= 1
+                if depth == 0:
+                    return raw[start : i + 1]
+        return None
+
     async def pick_best_article_for_linkedin(self, model: str, candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
         prompt = (
             "You are a LinkedIn editor for a Moroccan tech/cybersecurity audience. "
             "Pick the single best article to post today for maximum engagement and usefulness.\n\n"
             "Return ONLY valid JSON with keys: selected_index (0-based integer), reason_short (string).\n\n"
-            f"CANDIDATES_JSON:\n{json.dumps(candidates, ensure_ascii=False)}\n"
+            f"CANDIDATES_JSON:\n{orjson.dumps(candidates).decode('utf-8')}\n"
         )
 
-        resp = await self.chat(
-            {
-                "model": model,
-                "messages": [{"role": "user", "content": prompt}],
-            }
-        )
-        text = self._extract_text(resp)
-        return self._extract_json_from_text(text)
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0,
+        }
+        resp = await self.chat(payload)
+        picked = await self._parse_json_text(self._extract_text(resp))
+        if "selected_index" not in picked:
+            await self._forget(payload)
+        return picked
 
     async def pick_linkedin_template(self, model: str, blog_text: str, templates_text: str) -> Dict[str, Any]:
-        prompt = (
-            "You are a LinkedIn copy chief. Select the best template from the provided list for the blog below. "
-            "Prefer Darija-first bilingual output.\n\n"
-            "Return ONLY valid JSON with keys: template_number (integer 1-9), template_name (string), reason_short (string).\n\n"
-            f"TEMPLATES:\n{templates_text}\n\n"
-            f"BLOG_TEXT:\n{blog_text[:6000]}\n"
-        )
-
-        resp = await self.chat(
-            {
-                "model": model,
-                "messages": [{"role": "user", "content": prompt}],
-            }
-        )
-        text = self._extract_text(resp)
-        return self._extract_json_from_text(text)
+        payload = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": _template_pick_system_prompt(templates_text)},
+                {"role": "user", "content": f"BLOG_TEXT:\n{_clip(blog_text, 6000)}\n"},
+            ],
+            "temperature": 0,
+        }
+        resp = await self.chat(payload)
+        picked = await self._parse_json_text(self._extract_text(resp))
+        if "template_number" not in picked:
+            await self._forget(payload)
+        return picked
 
     async def generate_linkedin_draft(
         self,
@@ -214,22 +558,12 @@ class HackClubAIClient:
         link_url: str,
         brand: str,
     ) -> Dict[str, Any]:
+        darija_excerpt = _clip(blog_darija, 8000)
+        en_excerpt = _clip(blog_en, 4000)
         prompt = (
-            "You write high-performing LinkedIn posts for Moroccan tech/cybersecurity. "
-            "Generate ONE bilingual LinkedIn post (primary Arabic Darija, short English secondary) based on the blog.\n\n"
-            "Rules:\n"
-            "- Do NOT include the URL in the post body. Put it in first_comment only.\n"
-            "- The post body should tease value and invite discussion.\n"
-            "- The first_comment must contain the link first on its own line, then the brand on a new line.\n"
-            "- Keep it human, punchy, and readable on LinkedIn.\n\n"
-            "- When writing in Darija, use Arabic letters (حروف عربية). Example: كاينة واحد الثغرة...\n"
-            "- Do NOT write Darija using Latin transliteration (Darija latine). Latin letters are allowed only for the short English part and for technical terms (CVE, MongoDB, npm, etc.).\n\n"
-            "Return ONLY valid JSON with keys:\n"
-            "chosen_template_number (int), post_text (string), first_comment (string), hashtags (array of strings).\n\n"
             f"CHOSEN_TEMPLATE_NUMBER: {template_number}\n\n"
-            f"TEMPLATES:\n{templates_text}\n\n"
-            f"BLOG_DARIJA:\n{blog_darija[:8000]}\n\n"
-            f"BLOG_ENGLISH:\n{blog_en[:4000]}\n\n"
+            f"BLOG_DARIJA:\n{darija_excerpt}\n\n"
+            f"BLOG_ENGLISH:\n{en_excerpt}\n\n"
             f"LINK_URL: {link_url}\n"
             f"BRAND: {brand}\n"
         )
@@ -237,11 +571,14 @@ class HackClubAIClient:
         resp = await self.chat(
             {
                 "model": model,
-                "messages": [{"role": "user", "content": prompt}],
+                "messages": [
+                    {"role": "system", "content": _draft_system_prompt(templates_text)},
+                    {"role": "user", "content": prompt},
+                ],
             }
         )
         text = self._extract_text(resp)
-        draft = self._extract_json_from_text(text)
+        draft = await self._parse_json_text(text)
 
         post_text = str(draft.get("post_text") or "").strip()
         if post_text:
@@ -277,7 +614,7 @@ class HackClubAIClient:
                     }
                 )
                 rewrite_text = self._extract_text(rewrite_resp)
-                rewrite_obj = self._extract_json_from_text(rewrite_text)
+                rewrite_obj = await self._parse_json_text(rewrite_text)
                 rewritten = str(rewrite_obj.get("post_text") or "").strip()
                 if rewritten:
                     rw_arabic, rw_latin = self._count_arabic_and_latin_letters(rewritten)
@@ -302,69 +639,43 @@ class HackClubAIClient:
             {
                 "model": model,
                 "messages": [{"role": "user", "content": prompt}],
+                "temperature": 0,
             }
         )
         return self._extract_text(resp).strip()
 
-    async def generate_manga_prompts(self, model: str, blog_text: str) -> str:
-        prompt = (
-            "You are a creative prompt engineer for manga/anime image generation.\n\n"
-            "Task: Convert a news blog article into 4 fully independent, colored manga image-generation prompts. "
-            "Each prompt corresponds to a manga page depicting the incident in a funny, exaggerated, manga/anime style, "
-            "with dialogue in Moroccan Darija.\n\n"
-            "Instructions:\n\n"
-            "1. Read the blog article carefully.\n"
-            "2. Generate 4 independent prompts (Page 1–4), each standalone:\n"
-            "   - Scene description:\n"
-            "     - Background\n"
-            "     - Characters (appearance, emotions, poses)\n"
-            "     - Key objects/metaphors (coins, malware, mnemonics, warning symbols)\n"
-            "     - Actions/comic exaggeration\n"
-            "   - Dialogue in Moroccan Darija:\n"
-            "     - Maximum 2 text blocks per page in Darija\n"
-            "     - English text allowed for names, logos, numbers, or technical terms\n"
-            "   - Visual style:\n"
-            "     - Manga/anime cyberpunk\n"
-            "     - Colored illustration\n"
-            "     - Strong black ink lines, sketchy/gritty textures\n"
-            "     - Color palette: dominant + accent colors (red for danger, neon for data, etc.)\n"
-            "     - Lighting, cinematic framing, focus\n"
-            "3. Main character rules:\n"
-            "   - If male, always wearing sportif outfit of MAS (Maghreb Association of Sport) of Fez\n"
-            "   - Maintain exaggerated facial expressions and gestures for humor\n"
-            "4. Each prompt must be self-contained; can be generated independently.\n"
-            "5. Output format: each prompt must be inside a fenced code block with language txt.\n\n"
-            "Page 1 Prompt:\n```txt\n...\n```\n"
-            "Page 2 Prompt:\n```txt\n...\n```\n"
-            "Page 3 Prompt:\n```txt\n...\n```\n"
-            "Page 4 Prompt:\n```txt\n...\n```\n\n"
-            "Requirements:\n\n"
-            "- Use metaphors for technical details: mnemonics, crypto theft, malware, backdoor, etc.\n"
-            "- Exaggerated expressions, humorous tone, but story clearly reflects the news incident.\n"
-            "- Colored manga only, no black-and-white.\n"
-            "- Ultra-detailed, cinematic composition, poster-quality illustration.\n\n"
-            "Input blog text:\n"
-            f"{blog_text}\n"
-        )
+    async def generate_manga_prompts(self, model: str, blog_text: str, use_cache: bool = True) -> str:
+        # Static rules first so the provider can reuse the shared prefix across items.
+        prompt = f"{_MANGA_PROMPT_RULES}{blog_text}\n"
 
         resp = await self.chat(
             {
                 "model": model,
                 "messages": [{"role": "user", "content": prompt}],
-            }
+            },
+            use_cache=use_cache,
         )
         return self._extract_text(resp).strip()
 
     async def generate_illustration(self, model: str, prompt: str, aspect_ratio: str = "16:9") -> Tuple[Optional[bytes], str]:
-        resp = await self.chat(
-            {
-                "model": model,
-                "messages": [{"role": "user", "content": prompt}],
-                "modalities": ["image", "text"],
-                "image_config": {"aspect_ratio": aspect_ratio},
-                "stream": False,
-            }
-        )
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "modalities": ["image", "text"],
+            "image_config": {"aspect_ratio": aspect_ratio},
+            "stream": False,
+        }
+        # Image responses are never replayed by chat(); cache the decoded result instead
+        # so a retried item does not pay for the same page twice.
+        key = cache_key(payload) if self._cache is not None else None
+        if key is not None:
+            cached = await asyncio.to_thread(self._cache.get_image, key)
+            if cached is not None:
+                logger.info("ai_image_cache_hit model=%s", model)
+                return cached
+
+        async with self._image_sem:
+            resp = await self.chat(payload)
 
         text = self._extract_text(resp).strip()
         image_bytes = self._extract_image_bytes(resp)
@@ -373,94 +684,71 @@ class HackClubAIClient:
             if image_url:
                 image_bytes = await self._download_image(image_url)
 
+        if key is not None and image_bytes:
+            await asyncio.to_thread(self._cache.set_image, key, image_bytes, text)
         return image_bytes, text
 
-    def _extract_image_bytes(self, resp: Dict[str, Any]) -> Optional[bytes]:
-        choices = resp.get("choices")
-        if not isinstance(choices, list) or not choices:
-            return None
-
-        msg = (choices[0] or {}).get("message") or {}
-
-        images = msg.get("images")
-        if isinstance(images, list):
-            for p in images:
-                if not isinstance(p, dict):
-                    continue
-
-                image_url = p.get("image_url") if isinstance(p.get("image_url"), dict) else None
-                url = (image_url or {}).get("url")
-                if isinstance(url, str) and url.startswith("data:"):
-                    return self._decode_data_url(url)
+    async def generate_illustrations(
+        self, model: str, prompts: List[str], aspect_ratio: str = "16:9"
+    ) -> List[Tuple[Optional[bytes], str]]:
+        # Let every page settle before surfacing a failure, so sibling requests are not left
+        # running unobserved and their (cached) results are not wasted.
+        results = await asyncio.gather(
+            *[self.generate_illustration(model, p, aspect_ratio) for p in prompts], return_exceptions=True
+        )
+        out: List[Tuple[Optional[bytes], str]] = []
+        for res in results:
+            if isinstance(res, BaseException):
+                raise res
+            out.append(res)
+        return out
 
-                if p.get("type") == "image" and isinstance(p.get("data"), str):
-                    try:
-                        return base64.b64decode(p["data"], validate=True)
-                    except Exception:
-                        return None
+    @staticmethod
+    def _iter_image_parts(msg: Dict[str, Any]) -> Iterator[Tuple[bool, Dict[str, Any]]]:
+        # Yields (from_images, part) for the dict parts of message.images, then message.content.
+        for key, from_images in (("images", True), ("content", False)):
+            parts = msg.get(key)
+            if not isinstance(parts, list):
+                continue
+            for p in parts:
+                if isinstance(p, dict):
+                    yield from_images, p
 
-        content = msg.get("content")
-        if not isinstance(content, list):
+    @staticmethod
+    def _part_image_url(from_images: bool, p: Dict[str, Any]) -> Optional[str]:
+        if not from_images and p.get("type") != "image_url":
             return None
+        image_url = p.get("image_url")
+        url = image_url.get("url") if isinstance(image_url, dict) else None
+        return url if isinstance(url, str) else None
 
-        for p in content:
-            if not isinstance(p, dict):
-                continue
-
-            if p.get("type") == "image_url":
-                image_url = p.get("image_url") or {}
-                url = image_url.get("url")
-                if isinstance(url, str) and url.startswith("data:"):
-                    return self._decode_data_url(url)
+    def _extract_image_bytes(self, resp: Dict[str, Any]) -> Optional[bytes]:
+        for from_images, p in self._iter_image_parts(self._first_message(resp)):
+            url = self._part_image_url(from_images, p)
+            if url is not None and url.startswith(_DATA_PREFIX):
+                return self._decode_data_url(url)
 
             if p.get("type") == "image" and isinstance(p.get("data"), str):
                 try:
-                    return base64.b64decode(p["data"], validate=True)
+                    return base64.b64decode(p["data"])
                 except Exception:
                     return None
 
         return None
 
     def _extract_image_http_url(self, resp: Dict[str, Any]) -> Optional[str]:
-        choices = resp.get("choices")
-        if not isinstance(choices, list) or not choices:
-            return None
-
-        msg = (choices[0] or {}).get("message") or {}
-
-        images = msg.get("images")
-        if isinstance(images, list):
-            for p in images:
-                if not isinstance(p, dict):
-                    continue
-                image_url = p.get("image_url") if isinstance(p.get("image_url"), dict) else None
-                url = (image_url or {}).get("url")
-                if isinstance(url, str) and (url.startswith("https://") or url.startswith("http://")):
-                    return url
-
-        content = msg.get("content")
-        if not isinstance(content, list):
-            return None
-
-        for p in content:
-            if not isinstance(p, dict):
-                continue
-            if p.get("type") != "image_url":
-                continue
-
-            image_url = p.get("image_url") or {}
-            url = image_url.get("url")
-            if isinstance(url, str) and (url.startswith("https://") or url.startswith("http://")):
+        for from_images, p in self._iter_image_parts(self._first_message(resp)):
+            url = self._part_image_url(from_images, p)
+            if url is not None and url.startswith(_HTTP_PREFIXES):
                 return url
 
         return None
 
     async def _download_image(self, url: str) -> Optional[bytes]:
         try:
-            async with httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=10.0)) as client:
-                r = await client.get(url, follow_redirects=True)
-                r.raise_for_status()
-                return r.content
+            r = await self._image_client.get(url)
+            r.raise_for_status()
+            return r.content
         except Exception:
             return None
 
@@ -470,6 +758,6 @@ class HackClubAIClient:
             header, b64 = data_url.split(",", 1)
             if ";base64" not in header:
                 return None
-            return base64.b64decode(b64, validate=True)
+            return base64.b64decode(b64)
         except Exception:
             return None
@@ -1,5 +1,7 @@
+import functools
 import os
 from dataclasses import dataclass
+from typing import Mapping
 
 
 @dataclass(frozen=True)
@@ -11,6 +13,13 @@ class Config:
     prompts_model: str
     image_model: str
 
+    ai_cache_path: str
+    ai_cache_ttl_seconds: int
+    ai_max_concurrency: int
+    image_concurrency: int
+    semantic_cache_threshold: float
+    image_max_width: int
+
     s3_bucket: str
     s3_prefix: str
 
@@ -25,39 +34,74 @@ class Config:
 
     db_path: str
     output_dir: str
+    write_local: bool
 
     max_items: int
+    max_concurrency: int
 
 
-def load_config() -> Config:
-    ai_base_url = os.environ.get("AI_BASE_URL", "https://ai.hackclub.com/proxy/v1/chat/completions")
-    ai_api_key = os.environ.get("AI_API_KEY") or os.environ.get("HACKCLUB_API_KEY") or ""
+_TRUTHY = {"1", "true", "yes", "y"}
 
-    blog_model = os.environ.get("BLOG_MODEL", "qwen/qwen3-32b")
-    darija_model = os.environ.get("DARIJA_MODEL", blog_model)
-    prompts_model = os.environ.get("PROMPTS_MODEL", darija_model)
-    image_model = os.environ.get("IMAGE_MODEL", "google/gemini-2.5-flash-image-preview")
 
-    s3_bucket = os.environ.get("S3_BUCKET", "")
-    s3_prefix = os.environ.get("S3_PREFIX", "hn-generated").strip("/")
+def _env_flag(env: Mapping[str, str], name: str, default: str) -> bool:
+    return env.get(name, default).strip().lower() in _TRUTHY
 
-    blog_site_base_url = os.environ.get("BLOG_SITE_BASE_URL", "").rstrip("/")
-    blog_site_post_url_template = os.environ.get("BLOG_SITE_POST_URL_TEMPLATE", "/posts/{slug}")
 
-    linkedin_enable = (os.environ.get("LINKEDIN_ENABLE", "0").strip().lower() in {"1", "true", "yes", "y"})
-    linkedin_dry_run = (os.environ.get("LINKEDIN_DRY_RUN", "1").strip().lower() in {"1", "true", "yes", "y"})
-    linkedin_force = (os.environ.get("LINKEDIN_FORCE", "0").strip().lower() in {"1", "true", "yes", "y"})
-    linkedin_model = os.environ.get("LINKEDIN_MODEL", darija_model)
-    linkedin_brand = os.environ.get("LINKEDIN_BRAND", "The Hacker News B'Darija")
+def _env_int(env: Mapping[str, str], name: str, default: int) -> int:
+    try:
+        return int(env.get(name, str(default)))
+    except ValueError:
+        return default
 
-    db_path = os.environ.get("DB_PATH", "agent_state.sqlite")
-    output_dir = os.environ.get("OUTPUT_DIR", "agent_output")
 
-    max_items_raw = os.environ.get("MAX_ITEMS", "5")
+def _env_float(env: Mapping[str, str], name: str, default: float) -> float:
     try:
-        max_items = int(max_items_raw)
+        return float(env.get(name, str(default)))
     except ValueError:
-        max_items = 5
+        return default
+
+
+@functools.lru_cache(maxsize=1)
+def load_config() -> Config:
+    # Config is frozen, so one snapshot of the environment per process is safe to share.
+    env = os.environ
+
+    ai_base_url = env.get("AI_BASE_URL", "https://ai.hackclub.com/proxy/v1/chat/completions")
+    ai_api_key = env.get("AI_API_KEY") or env.get("HACKCLUB_API_KEY") or ""
+
+    blog_model = env.get("BLOG_MODEL", "qwen/qwen3-32b")
+    darija_model = env.get("DARIJA_MODEL", blog_model)
+    prompts_model = env.get("PROMPTS_MODEL", darija_model)
+    image_model = env.get("IMAGE_MODEL", "google/gemini-2.5-flash-image-preview")
+
+    ai_cache_path = env.get("AI_CACHE_PATH", "")
+    ai_cache_ttl_seconds = _env_int(env, "AI_CACHE_TTL_SECONDS", 604800)
+    ai_max_concurrency = _env_int(env, "AI_MAX_CONCURRENCY", 8)
+    image_concurrency = _env_int(env, "IMAGE_CONCURRENCY", 4)
+    # 0 disables near-duplicate skipping; it also needs AI_CACHE_PATH for storage.
+    semantic_cache_threshold = _env_float(env, "SEMANTIC_CACHE_THRESHOLD", 0.0)
+    # 0 keeps the model's PNGs as-is; otherwise pages are downscaled to JPEG (needs Pillow).
+    image_max_width = _env_int(env, "IMAGE_MAX_WIDTH", 0)
+
+    s3_bucket = env.get("S3_BUCKET", "")
+    s3_prefix = env.get("S3_PREFIX", "hn-generated").strip("/")
+
+    blog_site_base_url = env.get("BLOG_SITE_BASE_URL", "").rstrip("/")
+    blog_site_post_url_template = env.get("BLOG_SITE_POST_URL_TEMPLATE", "/posts/{slug}")
+
+    linkedin_enable = _env_flag(env, "LINKEDIN_ENABLE", "0")
+    linkedin_dry_run = _env_flag(env, "LINKEDIN_DRY_RUN", "1")
+    linkedin_force = _env_flag(env, "LINKEDIN_FORCE", "0")
+    linkedin_model = env.get("LINKEDIN_MODEL", darija_model)
+    linkedin_brand = env.get("LINKEDIN_BRAND", "The Hacker News B'Darija")
+
+    db_path = env.get("DB_PATH", "agent_state.sqlite")
+    output_dir = env.get("OUTPUT_DIR", "agent_output")
+    # S3 is the source of truth; on Lambda /tmp is small, so local copies default off there.
+    write_local = _env_flag(env, "WRITE_LOCAL", "0" if env.get("AWS_LAMBDA_FUNCTION_NAME") else "1")
+
+    max_items = _env_int(env, "MAX_ITEMS", 5)
+    max_concurrency = _env_int(env, "MAX_CONCURRENCY", 4)
 
     return Config(
         ai_base_url=ai_base_url,
@@ -66,6 +110,12 @@ def load_config() -> Config:
         darija_model=darija_model,
         prompts_model=prompts_model,
         image_model=image_model,
+        ai_cache_path=ai_cache_path,
+        ai_cache_ttl_seconds=ai_cache_ttl_seconds,
+        ai_max_concurrency=ai_max_concurrency,
+        image_concurrency=image_concurrency,
+        semantic_cache_threshold=semantic_cache_threshold,
+        image_max_width=image_max_width,
         s3_bucket=s3_bucket,
         s3_prefix=s3_prefix,
         blog_site_base_url=blog_site_base_url,
@@ -77,5 +127,7 @@ def load_config() -> Config:
         linkedin_brand=linkedin_brand,
         db_path=db_path,
         output_dir=output_dir,
+        write_local=write_local,
         max_items=max_items,
+        max_concurrency=max_concurrency,
     )
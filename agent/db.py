@@ -1,15 +1,32 @@
 import sqlite3
 import time
-from typing import Optional
+from typing import Any, Callable, FrozenSet, List, Optional
 
 
 def connect(db_path: str) -> sqlite3.Connection:
-    conn = sqlite3.connect(db_path)
+    # Writes may be issued from worker threads; callers serialize access to the connection.
+    conn = sqlite3.connect(db_path, check_same_thread=False)
     conn.execute("PRAGMA journal_mode=WAL")
     conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA wal_autocheckpoint=1000")
+    conn.execute("PRAGMA analysis_limit=400")
     return conn
 
 
+def close(conn: sqlite3.Connection) -> None:
+    # Truncate the -wal file so it does not grow across runs, then refresh planner stats.
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA optimize")
+    except sqlite3.Error:
+        pass
+    conn.close()
+
+
 def init(conn: sqlite3.Connection) -> None:
     conn.execute(
         """
@@ -28,51 +45,81 @@ def init(conn: sqlite3.Connection) -> None:
     conn.commit()
 
 
-def was_completed(conn: sqlite3.Connection, source_url: str) -> bool:
-    row = conn.execute(
-        "SELECT 1 FROM posts WHERE source_url = ? AND status = 'completed' LIMIT 1",
-        (source_url,),
-    ).fetchone()
-    return row is not None
+def completed_urls(conn: sqlite3.Connection, source_urls: List[str]) -> FrozenSet[str]:
+    if not source_urls:
+        return frozenset()
+    placeholders = ",".join("?" * len(source_urls))
+    rows = conn.execute(
+        f"SELECT source_url FROM posts WHERE status IN ('completed', 'duplicate') AND source_url IN ({placeholders})",
+        source_urls,
+    )
+    return frozenset(row[0] for row in rows)
 
 
-def mark_started(conn: sqlite3.Connection, source_url: str, source_title: Optional[str]) -> None:
-    now = int(time.time())
-    conn.execute(
+def post_status(conn: sqlite3.Connection, source_url: str) -> Optional[str]:
+    row = conn.execute("SELECT status FROM posts WHERE source_url = ?", (source_url,)).fetchone()
+    return row[0] if row is not None else None
+
+
+def try_claim(
+    conn: sqlite3.Connection, source_url: str, source_title: Optional[str], now: Optional[int] = None
+) -> bool:
+    if now is None:
+        now = int(time.time())
+    # rowcount counts the inserted or updated row and is 0 when the WHERE skipped the
+    # update; unlike RETURNING this works on SQLite releases older than 3.35.
+    cur = conn.execute(
         """
         INSERT INTO posts (source_url, source_title, status, created_at, updated_at)
         VALUES (?, ?, 'started', ?, ?)
         ON CONFLICT(source_url) DO UPDATE SET
             source_title=excluded.source_title,
             status='started',
-            updated_at=?
+            updated_at=excluded.updated_at
+        WHERE posts.status NOT IN ('completed', 'duplicate')
         """,
-        (source_url, source_title, now, now, now),
+        (source_url, source_title, now, now),
     )
-    conn.commit()
+    return cur.rowcount > 0
 
 
-def mark_completed(conn: sqlite3.Connection, source_url: str, s3_prefix: str) -> None:
-    now = int(time.time())
+def record_final(
+    conn: sqlite3.Connection,
+    source_url: str,
+    status: str,
+    s3_prefix: Optional[str] = None,
+    error: Optional[str] = None,
+    now: Optional[int] = None,
+) -> None:
+    if now is None:
+        now = int(time.time())
     conn.execute(
         """
-        UPDATE posts
-        SET status='completed', s3_prefix=?, error=NULL, updated_at=?
-        WHERE source_url=?
+        INSERT INTO posts (source_url, status, created_at, updated_at, s3_prefix, error)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(source_url) DO UPDATE SET
+            status=excluded.status,
+            s3_prefix=COALESCE(excluded.s3_prefix, posts.s3_prefix),
+            error=excluded.error,
+            updated_at=excluded.updated_at
         """,
-        (s3_prefix, now, source_url),
+        (source_url, status, now, now, s3_prefix, error[:2000] if error is not None else None),
     )
-    conn.commit()
 
 
-def mark_failed(conn: sqlite3.Connection, source_url: str, error: str) -> None:
-    now = int(time.time())
-    conn.execute(
-        """
-        UPDATE posts
-        SET status='failed', error=?, updated_at=?
-        WHERE source_url=?
-        """,
-        (error[:2000], now, source_url),
-    )
-    conn.commit()
+def in_transaction(conn: sqlite3.Connection, fn: Callable[..., None], *args: Any, **kwargs: Any) -> None:
+    with conn:
+        fn(conn, *args, **kwargs)
+
+
+def mark_completed(conn: sqlite3.Connection, source_url: str, s3_prefix: str, now: Optional[int] = None) -> None:
+    record_final(conn, source_url, "completed", s3_prefix=s3_prefix, now=now)
+
+
+def mark_failed(conn: sqlite3.Connection, source_url: str, error: str, now: Optional[int] = None) -> None:
+    record_final(conn, source_url, "failed", error=error, now=now)
+
+
+def mark_duplicate(conn: sqlite3.Connection, source_url: str, duplicate_of: str, now: Optional[int] = None) -> None:
+    # Terminal like "completed", so the story is not fetched and checked again every run.
+    record_final(conn, source_url, "duplicate", error=f"near_duplicate_of={duplicate_of}", now=now)
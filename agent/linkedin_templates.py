@@ -193,3 +193,5 @@ LINKEDIN_TEMPLATES_TEXT = """### Category A: Breaking News & Alerts (The Core \"
 >
 > #DevLife #BugFix #StoryTime
 """
+
+LINKEDIN_TEMPLATES_BYTES = LINKEDIN_TEMPLATES_TEXT.encode("utf-8")
@@ -0,0 +1,112 @@
+import functools
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import orjson
+
+
+@functools.lru_cache(maxsize=32)
+def _content_digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def cache_key(payload: Dict[str, Any]) -> str:
+    # Message bodies are keyed by digest so that large, stable prefixes such as the
+    # LinkedIn template catalogue are hashed once per run rather than per call.
+    messages = [
+        {**m, "content": _content_digest(m["content"])} if isinstance(m.get("content"), str) else m
+        for m in payload.get("messages") or []
+        if isinstance(m, dict)
+    ]
+    raw = json.dumps({**payload, "messages": messages}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    # Calls are synchronous and serialized; run them via asyncio.to_thread, since image
+    # rows are multi-MB blobs and every set commits.
+    def __init__(self, path: str, ttl_seconds: int) -> None:
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at INTEGER NOT NULL
+            )
+            """
+        )
+        # Generated images are stored decoded, so a retried item skips both the
+        # image model and the base64/CDN round trip.
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS images (
+                key TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                caption TEXT NOT NULL,
+                expires_at INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE key = ? AND expires_at > ?",
+                (key, int(time.time())),
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            value = orjson.loads(row[0])
+        except orjson.JSONDecodeError:
+            return None
+        return value if isinstance(value, dict) else None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        raw = orjson.dumps(value).decode("utf-8")
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO responses (key, value, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET value=excluded.value, expires_at=excluded.expires_at
+                """,
+                (key, raw, int(time.time()) + self._ttl_seconds),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def get_image(self, key: str) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, caption FROM images WHERE key = ? AND expires_at > ?",
+                (key, int(time.time())),
+            ).fetchone()
+        if row is None:
+            return None
+        return bytes(row[0]), row[1]
+
+    def set_image(self, key: str, data: bytes, caption: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO images (key, data, caption, expires_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    data=excluded.data, caption=excluded.caption, expires_at=excluded.expires_at
+                """,
+                (key, data, caption, int(time.time()) + self._ttl_seconds),
+            )
+
+    def close(self) -> None:
+        self._conn.close()
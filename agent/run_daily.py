@@ -1,56 +1,84 @@
+from __future__ import annotations
+
 import asyncio
-import json
+import functools
+import io
 import logging
 import os
 import re
+import sqlite3
 import sys
 import time
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
 
 import httpx
-from fpdf import FPDF
+import orjson
 
-from agent.ai_client import HackClubAIClient
-from agent.config import load_config
-from agent.linkedin_templates import LINKEDIN_TEMPLATES_TEXT
-from agent.s3_store import S3Store
+from agent.config import Config, load_config
+from agent.linkedin_templates import LINKEDIN_TEMPLATES_BYTES, LINKEDIN_TEMPLATES_TEXT
+from agent.llm_cache import ResponseCache
+from agent.semantic_cache import NearDuplicateCache
 from agent import db
 from agent import thn
 
+if TYPE_CHECKING:
+    from agent.ai_client import HackClubAIClient
+    from agent.s3_store import S3Store
+
 
 logger = logging.getLogger("hn_agent")
 
+# Shared HTTP pool size; also bounds how many article prefetches run at once.
+_HTTP_MAX_CONNECTIONS = 200
+# Streamed blog text is written out in batches of about this many characters.
+_STREAM_FLUSH_CHARS = 16 * 1024
+
+# Deletes every ASCII character a slug may not contain; non-ASCII is dropped by the
+# ascii encode in _slugify.
+_SLUG_DELETE = str.maketrans("", "", "".join(chr(i) for i in range(128) if not (chr(i).isalnum() or chr(i) == "-")))
+_TXT_BLOCK = re.compile(r"```(?:txt|text)\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+_ANY_FENCE_BLOCK = re.compile(r"```[^\n]*\n(.*?)```", re.DOTALL)
+# "Page N" headings ("Page 1 Prompt:", "**Page 2:**", "### Page 3") start each prompt in an unfenced reply.
+_PAGE_BLOCK = re.compile(
+    r"^[#* \t]*Page[ \t]+\d+\b[^\n:]*:?[ \t*]*(.*?)(?=^[#* \t]*Page[ \t]+\d+\b|\Z)",
+    re.DOTALL | re.MULTILINE | re.IGNORECASE,
+)
+
 
 class _ColorFormatter(logging.Formatter):
     _RESET = "\x1b[0m"
     _COLORS = {
-        "DEBUG": "\x1b[90m",
-        "INFO": "\x1b[36m",
-        "WARNING": "\x1b[33m",
-        "ERROR": "\x1b[31m",
-        "CRITICAL": "\x1b[41m\x1b[97m",
+        logging.DEBUG: "\x1b[90m",
+        logging.INFO: "\x1b[36m",
+        logging.WARNING: "\x1b[33m",
+        logging.ERROR: "\x1b[31m",
+        logging.CRITICAL: "\x1b[41m\x1b[97m",
     }
 
     def __init__(self, *, use_color: bool) -> None:
         super().__init__(fmt="%(asctime)s %(levelname)s %(name)s %(message)s")
-        self._use_color = use_color
+        # Keyed by levelno so the per-record lookup is a single int-keyed dict hit; empty
+        # when colors are off, which makes format() fall straight through.
+        self._colored: Dict[int, str] = {}
+        if use_color:
+            self._colored = {lvl: f"{c}{logging.getLevelName(lvl)}{self._RESET}" for lvl, c in self._COLORS.items()}
 
     def format(self, record: logging.LogRecord) -> str:
-        if not self._use_color:
+        colored = self._colored.get(record.levelno)
+        if colored is None:
             return super().format(record)
-
         original_levelname = record.levelname
         try:
-            color = self._COLORS.get(original_levelname)
-            if color:
-                record.levelname = f"{color}{original_levelname}{self._RESET}"
+            record.levelname = colored
             return super().format(record)
         finally:
             record.levelname = original_levelname
 
 
+@functools.lru_cache(maxsize=1)
 def _should_use_colors() -> bool:
     if os.environ.get("NO_COLOR") is not None:
         return False
@@ -75,26 +103,115 @@ def _configure_logging() -> None:
             logging.getLogger(noisy).setLevel(logging.WARNING)
 
 
+@functools.lru_cache(maxsize=1024)
 def _slugify(value: str) -> str:
-    v = (value or "").strip().lower()
-    v = re.sub(r"[^a-z0-9\s-]", "", v)
-    v = re.sub(r"[\s-]+", "-", v).strip("-")
-    return v or "post"
+    # Whitespace runs become single dashes, disallowed characters are removed, then dash
+    # runs are collapsed and trimmed; same result as the former two regex passes.
+    v = "-".join((value or "").lower().split())
+    v = v.translate(_SLUG_DELETE).encode("ascii", "ignore").decode("ascii")
+    return "-".join(filter(None, v.split("-"))) or "post"
+
+
+# Slots are declared by hand rather than with dataclass(slots=True), which needs Python 3.10.
+@dataclass
+class LinkedinCandidate:
+    __slots__ = (
+        "title",
+        "source_url",
+        "slug",
+        "blog_url",
+        "summary",
+        "tags",
+        "out_dir",
+        "blog_en",
+        "blog_darija",
+    )
+
+    title: str
+    source_url: str
+    slug: str
+    blog_url: str
+    summary: str
+    tags: str
+    out_dir: Path
+    blog_en: str
+    blog_darija: str
+
+    # The subset of fields shown to the model when picking the article to post.
+    def for_ai(self) -> Dict[str, Any]:
+        return {
+            "title": self.title,
+            "source_url": self.source_url,
+            "blog_url": self.blog_url,
+            "summary": self.summary,
+            "tags": self.tags,
+        }
 
 
+def _dumps_pretty(obj: Any) -> bytes:
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+
+
+# Callers create the target directory once up-front; these only write.
 def _write_text(path: Path, content: str) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
     path.write_text(content, encoding="utf-8")
 
 
 def _write_bytes(path: Path, content: bytes) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
     path.write_bytes(content)
 
 
+async def _save(enabled: bool, path: Path, content: Union[str, bytes, bytearray]) -> None:
+    if not enabled:
+        return
+    if isinstance(content, str):
+        await asyncio.to_thread(_write_text, path, content)
+    else:
+        await asyncio.to_thread(_write_bytes, path, content)
+
+
+def _finish_stream_file(f: io.BufferedWriter, tail: bytes, size: int) -> None:
+    f.write(tail)
+    f.truncate(size)
+    f.close()
+
+
+async def _stream_text_to_file(chunks: AsyncIterator[str], path: Optional[Path]) -> str:
+    # Writes deltas in batches as they arrive so the file fills in while the model is
+    # still generating; all file I/O runs in a worker thread. The result (and the file)
+    # match the stripped full text. With no path the deltas are only collected.
+    parts: List[str] = []
+    pending: List[str] = []
+    pending_chars = 0
+    f = await asyncio.to_thread(path.open, "wb") if path is not None else None
+    try:
+        async for chunk in chunks:
+            if not parts:
+                chunk = chunk.lstrip()
+                if not chunk:
+                    continue
+            parts.append(chunk)
+            if f is None:
+                continue
+            pending.append(chunk)
+            pending_chars += len(chunk)
+            if pending_chars >= _STREAM_FLUSH_CHARS:
+                await asyncio.to_thread(f.write, "".join(pending).encode("utf-8"))
+                pending, pending_chars = [], 0
+        text = "".join(parts).rstrip()
+        if f is not None:
+            await asyncio.to_thread(
+                _finish_stream_file, f, "".join(pending).encode("utf-8"), len(text.encode("utf-8"))
+            )
+            f = None
+    finally:
+        if f is not None:
+            await asyncio.to_thread(f.close)
+    return text
+
+
 async def _fetch_source_bundle(client: httpx.AsyncClient, item: Dict[str, Any]) -> Dict[str, Any]:
-    html = await thn.fetch_article_html(client, item["url"])
-    article = thn.parse_article(html, item["url"])
+    article = await thn.fetch_article(client, item["url"])
     bundle = dict(item)
     bundle["article"] = article
     return bundle
@@ -103,7 +220,7 @@ async def _fetch_source_bundle(client: httpx.AsyncClient, item: Dict[str, Any])
 def _extract_txt_codeblocks(text: str) -> List[str]:
     if not text:
         return []
-    blocks = re.findall(r"```(?:txt|text)\s*(.*?)```", text, flags=re.DOTALL | re.IGNORECASE)
+    blocks = _TXT_BLOCK.findall(text)
     out: List[str] = []
     for b in blocks:
         b = (b or "").strip()
@@ -113,6 +230,22 @@ def _extract_txt_codeblocks(text: str) -> List[str]:
     return out
 
 
+def _extract_prompts_lenient(text: str, want: int = 4) -> List[str]:
+    # Fallbacks for replies that have no ```txt fences at all: any fenced block, then
+    # "Page N" sections. A reply with some txt fences is a short reply, not a different
+    # format, so it goes to the retry instead. Only a pattern that yields enough clean
+    # prompts counts; a block holding a stray fence means the split went wrong.
+    if not text or _TXT_BLOCK.search(text):
+        return []
+    for pattern in (_ANY_FENCE_BLOCK, _PAGE_BLOCK):
+        blocks = [b.strip() for b in pattern.findall(text) if b and b.strip()]
+        if any("```" in b for b in blocks):
+            continue
+        if len(blocks) >= want:
+            return blocks
+    return []
+
+
 def _build_blog_url(base_url: str, path_template: str, yyyy_mm_dd: str, slug: str) -> str:
     base = (base_url or "").rstrip("/")
     if not base:
@@ -127,6 +260,238 @@ def _build_blog_url(base_url: str, path_template: str, yyyy_mm_dd: str, slug: st
     return base + path
 
 
+def _shrink_page_images(page_images: List[bytes], max_width: int) -> Tuple[List[bytes], str, str]:
+    # Returns (images, file extension, content type). Model output is often ~2k px RGBA
+    # PNG, far more than an A4 page needs; JPEG at print width cuts PDF and upload size
+    # several-fold. Pillow is optional, so without it the PNGs pass through unchanged.
+    if max_width <= 0:
+        return page_images, "png", "image/png"
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.warning("image_shrink_skipped reason=pillow_not_installed")
+        return page_images, "png", "image/png"
+
+    out: List[bytes] = []
+    for raw in page_images:
+        with Image.open(io.BytesIO(raw)) as im:
+            im.thumbnail((max_width, max_width * 4 // 3), Image.LANCZOS)
+            buf = io.BytesIO()
+            im.convert("RGB").save(buf, "JPEG", quality=85, optimize=True, progressive=True)
+        out.append(buf.getvalue())
+    return out, "jpg", "image/jpeg"
+
+
+# Called via asyncio.to_thread: FPDF's image decoding and compression are CPU-bound.
+def _build_manga_pdf(page_images: List[bytes]) -> bytearray:
+    from fpdf import FPDF
+
+    pdf = FPDF(unit="mm", format="A4")
+    pdf.set_margins(0, 0, 0)
+    pdf.set_auto_page_break(auto=False)
+    for img_bytes in page_images:
+        pdf.add_page()
+        pdf.image(io.BytesIO(img_bytes), x=0, y=0, w=pdf.w, h=pdf.h)
+    # fpdf2 already returns a fresh bytearray; both the local write and S3 accept it as is.
+    return pdf.output()
+
+
+async def _db_write(
+    conn: sqlite3.Connection, lock: Optional[asyncio.Lock], fn: Callable[..., None], *args: Any, **kwargs: Any
+) -> None:
+    # Runs one committed write off the event loop; the lock keeps the shared connection
+    # to a single worker thread at a time.
+    if lock is None:
+        db.in_transaction(conn, fn, *args, **kwargs)
+        return
+    async with lock:
+        await asyncio.to_thread(db.in_transaction, conn, fn, *args, **kwargs)
+
+
+async def _db_read(conn: sqlite3.Connection, lock: Optional[asyncio.Lock], fn: Callable[..., Any], *args: Any) -> Any:
+    # Read counterpart of _db_write, serialized on the same lock.
+    if lock is None:
+        return fn(conn, *args)
+    async with lock:
+        return await asyncio.to_thread(fn, conn, *args)
+
+
+async def _process_item(
+    item: Dict[str, Any],
+    *,
+    cfg: Config,
+    http: httpx.AsyncClient,
+    ai: HackClubAIClient,
+    store: S3Store,
+    conn: sqlite3.Connection,
+    base_out: Path,
+    today: str,
+    near_cache: Optional[NearDuplicateCache] = None,
+    source_task: Optional["asyncio.Future[Dict[str, Any]]"] = None,
+    db_lock: Optional[asyncio.Lock] = None,
+) -> Tuple[bool, Optional[LinkedinCandidate]]:
+    # Returns (completed, linkedin_candidate); the candidate is set as soon as the
+    # blog and its Darija translation exist, even if a later stage fails.
+    url = item["url"]
+    title = item.get("title")
+    slug = _slugify(title or url)
+    out_dir = base_out / slug
+    linkedin_candidate: Optional[LinkedinCandidate] = None
+
+    try:
+        item_t0 = time.monotonic()
+        logger.info("process_start url=%s slug=%s", url, slug)
+        if cfg.write_local:
+            out_dir.mkdir(parents=True, exist_ok=True)
+
+        logger.info("running fetch_source url=%s", url)
+        source = await (source_task if source_task is not None else _fetch_source_bundle(http, item))
+        source_json = _dumps_pretty(source)
+        await _save(cfg.write_local, out_dir / "source.json", source_json)
+        logger.info("source_fetched url=%s", url)
+
+        article_text = source.get("article", {}).get("text") or ""
+        if near_cache is not None:
+            near_url = await asyncio.to_thread(near_cache.find, article_text)
+            near_status = None
+            if near_url is not None and near_url != url:
+                near_status = await _db_read(conn, db_lock, db.post_status, near_url)
+            if near_status == "completed":
+                # Another copy of this story was already published; a second post for it
+                # would only repeat that one.
+                logger.info("skip_near_duplicate url=%s matched=%s", url, near_url)
+                await _db_write(conn, db_lock, db.mark_duplicate, url, near_url)
+                return False, None
+            if near_status is not None:
+                logger.info("near_duplicate_not_final url=%s matched=%s status=%s", url, near_url, near_status)
+
+        logger.info("running generate_blog model=%s", cfg.blog_model)
+        blog_en = await _stream_text_to_file(
+            ai.stream_blog_markdown(cfg.blog_model, source), out_dir / "blog_en.md" if cfg.write_local else None
+        )
+        logger.info("blog_generated url=%s chars=%s", url, len(blog_en))
+
+        logger.info("running translate_darija model=%s", cfg.darija_model)
+        blog_darija = await ai.translate_to_darija(cfg.darija_model, blog_en)
+        await _save(cfg.write_local, out_dir / "blog_darija.md", blog_darija)
+        logger.info("darija_translated url=%s chars=%s", url, len(blog_darija))
+
+        blog_url = _build_blog_url(cfg.blog_site_base_url, cfg.blog_site_post_url_template, today, slug) or url
+        linkedin_candidate = LinkedinCandidate(
+            title=title or "",
+            source_url=url,
+            slug=slug,
+            blog_url=blog_url,
+            summary=source.get("description") or item.get("description") or "",
+            tags=item.get("tags") or "",
+            out_dir=out_dir,
+            blog_en=blog_en,
+            blog_darija=blog_darija,
+        )
+
+        # The prompts are built from the Darija text so the page dialogue comes out in Darija.
+        logger.info("running generate_manga_prompts model=%s", cfg.prompts_model)
+        manga_prompts_raw = await ai.generate_manga_prompts(cfg.prompts_model, blog_darija)
+        await _save(cfg.write_local, out_dir / "manga_prompts.md", manga_prompts_raw)
+
+        prompts = _extract_txt_codeblocks(manga_prompts_raw)
+        if len(prompts) < 4:
+            lenient = _extract_prompts_lenient(manga_prompts_raw)
+            if lenient:
+                logger.info("manga_prompts_lenient_parse found=%s", len(lenient))
+                prompts = lenient
+        if len(prompts) < 4:
+            logger.warning("manga_prompts_incomplete found=%s", len(prompts))
+            logger.info("running generate_manga_prompts_retry model=%s", cfg.prompts_model)
+            # The first reply was rejected; never let a cached copy of it answer the retry.
+            manga_prompts_raw = await ai.generate_manga_prompts(cfg.prompts_model, blog_darija, use_cache=False)
+            await asyncio.gather(
+                _save(cfg.write_local, out_dir / "manga_prompts_retry.md", manga_prompts_raw),
+                _save(cfg.write_local, out_dir / "manga_prompts.md", manga_prompts_raw),
+            )
+            prompts = _extract_txt_codeblocks(manga_prompts_raw)
+            if len(prompts) < 4:
+                prompts = _extract_prompts_lenient(manga_prompts_raw) or prompts
+
+        if len(prompts) < 4:
+            raise RuntimeError(f"Expected 4 manga prompts, got {len(prompts)}")
+
+        logger.info("running generate_manga_images pages=4 model=%s", cfg.image_model)
+        illustrations = await ai.generate_illustrations(cfg.image_model, prompts[:4], aspect_ratio="3:4")
+
+        page_images: List[bytes] = []
+        page_captions: List[str] = []
+        for i, (img_bytes, caption) in enumerate(illustrations, start=1):
+            if not img_bytes:
+                raise RuntimeError(f"Image generation returned no bytes for page {i}")
+            page_images.append(img_bytes)
+            page_captions.append(caption or "")
+            logger.info("manga_image_generated page=%s bytes=%s", i, len(img_bytes))
+        page_images, page_ext, page_content_type = await asyncio.to_thread(
+            _shrink_page_images, page_images, cfg.image_max_width
+        )
+        await asyncio.gather(
+            *[
+                _save(cfg.write_local, out_dir / f"manga_page_{i}.{page_ext}", img_bytes)
+                for i, img_bytes in enumerate(page_images, start=1)
+            ]
+        )
+
+        pdf_bytes = await asyncio.to_thread(_build_manga_pdf, page_images)
+        await _save(cfg.write_local, out_dir / "manga_pages.pdf", pdf_bytes)
+        logger.info("manga_pdf_created bytes=%s", len(pdf_bytes))
+
+        generated_at = int(time.time())
+        meta = {
+            "source_url": url,
+            "generated_at": generated_at,
+            "models": {
+                "blog_model": cfg.blog_model,
+                "darija_model": cfg.darija_model,
+                "prompts_model": cfg.prompts_model,
+                "image_model": cfg.image_model,
+            },
+            "manga_page_captions": page_captions,
+        }
+        meta_json = _dumps_pretty(meta)
+        await _save(cfg.write_local, out_dir / "meta.json", meta_json)
+
+        s3_prefix = f"{today}/{slug}"
+        logger.info("running s3_upload prefix=%s", s3_prefix)
+        uploads = [
+            store.put_bytes_async(f"{s3_prefix}/source.json", source_json, "application/json"),
+            store.put_text_async(f"{s3_prefix}/blog_en.md", blog_en, "text/markdown; charset=utf-8"),
+            store.put_text_async(f"{s3_prefix}/blog_darija.md", blog_darija, "text/markdown; charset=utf-8"),
+            store.put_text_async(
+                f"{s3_prefix}/manga_prompts.md", manga_prompts_raw, "text/markdown; charset=utf-8"
+            ),
+            store.put_bytes_async(f"{s3_prefix}/meta.json", meta_json, "application/json"),
+            store.put_bytes_async(f"{s3_prefix}/manga_pages.pdf", pdf_bytes, "application/pdf"),
+            *[
+                store.put_bytes_async(f"{s3_prefix}/manga_page_{i}.{page_ext}", img_bytes, page_content_type)
+                for i, img_bytes in enumerate(page_images, start=1)
+            ],
+        ]
+        keys = await asyncio.gather(*uploads)
+
+        logger.info("s3_uploaded url=%s keys=%s", url, [k for k in keys if k])
+
+        await _db_write(conn, db_lock, db.mark_completed, url, s3_prefix, now=generated_at)
+        # Indexed only once published, so a failed item never makes its re-posts terminal.
+        if near_cache is not None:
+            try:
+                await asyncio.to_thread(near_cache.add, url, article_text)
+            except Exception:
+                logger.exception("near_cache_add_failed url=%s", url)
+        logger.info("process_done url=%s elapsed_s=%.3f", url, time.monotonic() - item_t0)
+        return True, linkedin_candidate
+
+    except Exception as e:
+        await _db_write(conn, db_lock, db.mark_failed, url, str(e))
+        logger.exception("process_failed url=%s", url)
+        return False, linkedin_candidate
+
+
 async def run_once() -> int:
     _configure_logging()
     cfg = load_config()
@@ -135,18 +500,23 @@ async def run_once() -> int:
     if not cfg.s3_bucket:
         raise RuntimeError("Missing S3_BUCKET")
 
-    logger.info(
-        "agent_start s3_bucket=%s s3_prefix=%s output_dir=%s db_path=%s max_items=%s blog_model=%s darija_model=%s prompts_model=%s image_model=%s",
-        cfg.s3_bucket,
-        cfg.s3_prefix,
-        cfg.output_dir,
-        cfg.db_path,
-        cfg.max_items,
-        cfg.blog_model,
-        cfg.darija_model,
-        cfg.prompts_model,
-        cfg.image_model,
-    )
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "agent_start s3_bucket=%s s3_prefix=%s output_dir=%s db_path=%s max_items=%s blog_model=%s darija_model=%s prompts_model=%s image_model=%s",
+            cfg.s3_bucket,
+            cfg.s3_prefix,
+            cfg.output_dir,
+            cfg.db_path,
+            cfg.max_items,
+            cfg.blog_model,
+            cfg.darija_model,
+            cfg.prompts_model,
+            cfg.image_model,
+        )
+
+    # Imported here so a run that fails config validation never pays for botocore.
+    from agent.ai_client import HackClubAIClient
+    from agent.s3_store import S3Store
 
     store = S3Store(bucket=cfg.s3_bucket, prefix=cfg.s3_prefix)
 
@@ -154,23 +524,40 @@ async def run_once() -> int:
     db.init(conn)
 
     http = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=_HTTP_MAX_CONNECTIONS, max_keepalive_connections=100, keepalive_expiry=30.0
+        ),
         timeout=httpx.Timeout(20.0, connect=10.0),
         headers={"User-Agent": "Mozilla/5.0"},
         follow_redirects=True,
     )
 
-    ai = HackClubAIClient(base_url=cfg.ai_base_url, api_key=cfg.ai_api_key)
+    ai_cache = ResponseCache(cfg.ai_cache_path, cfg.ai_cache_ttl_seconds) if cfg.ai_cache_path else None
+    near_cache = (
+        NearDuplicateCache(cfg.ai_cache_path, cfg.ai_cache_ttl_seconds, cfg.semantic_cache_threshold)
+        if cfg.ai_cache_path and cfg.semantic_cache_threshold > 0
+        else None
+    )
+    ai = HackClubAIClient(
+        base_url=cfg.ai_base_url,
+        api_key=cfg.ai_api_key,
+        cache=ai_cache,
+        max_concurrency=cfg.ai_max_concurrency,
+        http=http,
+        image_concurrency=cfg.image_concurrency,
+    )
 
     processed = 0
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     base_out = Path(cfg.output_dir) / today
-    linkedin_candidates: List[Dict[str, Any]] = []
+    linkedin_candidates: List[LinkedinCandidate] = []
 
     try:
         t0 = time.monotonic()
         logger.info("running fetch_listing")
         listing_html = await thn.fetch_listing_html(http)
-        listing = thn.parse_listing(listing_html)
+        listing = await asyncio.to_thread(thn.parse_listing, listing_html)
         candidates = thn.pick_candidates(listing, cfg.max_items)
         logger.info(
             "listing_fetched total=%s candidates=%s elapsed_s=%.3f",
@@ -179,141 +566,63 @@ async def run_once() -> int:
             time.monotonic() - t0,
         )
 
-        for item in candidates:
-            url = item.get("url")
-            if not url:
-                continue
-            if db.was_completed(conn, url):
-                logger.info("skip_completed url=%s", url)
-                continue
-
-            title = item.get("title")
-            db.mark_started(conn, url, title)
-
-            slug = _slugify(title or url)
-            out_dir = base_out / slug
-
-            try:
-                item_t0 = time.monotonic()
-                logger.info("process_start url=%s slug=%s", url, slug)
-
-                logger.info("running fetch_source url=%s", url)
-                source = await _fetch_source_bundle(http, item)
-                _write_text(out_dir / "source.json", json.dumps(source, ensure_ascii=False, indent=2))
-                logger.info("source_fetched url=%s", url)
-
-                logger.info("running generate_blog model=%s", cfg.blog_model)
-                blog_en = await ai.generate_blog_markdown(cfg.blog_model, source)
-                _write_text(out_dir / "blog_en.md", blog_en)
-                logger.info("blog_generated url=%s chars=%s", url, len(blog_en))
-
-                logger.info("running translate_darija model=%s", cfg.darija_model)
-                blog_darija = await ai.translate_to_darija(cfg.darija_model, blog_en)
-                _write_text(out_dir / "blog_darija.md", blog_darija)
-                logger.info("darija_translated url=%s chars=%s", url, len(blog_darija))
-
-                blog_url = _build_blog_url(cfg.blog_site_base_url, cfg.blog_site_post_url_template, today, slug) or url
-                linkedin_candidates.append(
-                    {
-                        "title": title or "",
-                        "source_url": url,
-                        "slug": slug,
-                        "blog_url": blog_url,
-                        "summary": source.get("description") or item.get("description") or "",
-                        "tags": item.get("tags") or "",
-                        "out_dir": str(out_dir),
-                    }
-                )
-
-                logger.info("running generate_manga_prompts model=%s", cfg.prompts_model)
-                manga_prompts_raw = await ai.generate_manga_prompts(cfg.prompts_model, blog_darija)
-                _write_text(out_dir / "manga_prompts.md", manga_prompts_raw)
-
-                prompts = _extract_txt_codeblocks(manga_prompts_raw)
-                if len(prompts) < 4:
-                    logger.warning("manga_prompts_incomplete found=%s", len(prompts))
-                    logger.info("running generate_manga_prompts_retry model=%s", cfg.prompts_model)
-                    manga_prompts_raw = await ai.generate_manga_prompts(cfg.prompts_model, blog_darija)
-                    _write_text(out_dir / "manga_prompts_retry.md", manga_prompts_raw)
-                    _write_text(out_dir / "manga_prompts.md", manga_prompts_raw)
-                    prompts = _extract_txt_codeblocks(manga_prompts_raw)
-
-                if len(prompts) < 4:
-                    raise RuntimeError(f"Expected 4 manga prompts, got {len(prompts)}")
-
-                page_images: List[bytes] = []
-                page_captions: List[str] = []
-                for i, p in enumerate(prompts[:4], start=1):
-                    logger.info("running generate_manga_image page=%s model=%s", i, cfg.image_model)
-                    img_bytes, caption = await ai.generate_illustration(cfg.image_model, p, aspect_ratio="3:4")
-                    if not img_bytes:
-                        raise RuntimeError(f"Image generation returned no bytes for page {i}")
-                    page_images.append(img_bytes)
-                    page_captions.append(caption or "")
-                    _write_bytes(out_dir / f"manga_page_{i}.png", img_bytes)
-                    logger.info("manga_image_generated page=%s bytes=%s", i, len(img_bytes))
-
-                pdf_path = out_dir / "manga_pages.pdf"
-                pdf = FPDF(unit="mm", format="A4")
-                pdf.set_margins(0, 0, 0)
-                pdf.set_auto_page_break(auto=False)
-                for i in range(1, 5):
-                    pdf.add_page()
-                    img_path = out_dir / f"manga_page_{i}.png"
-                    pdf.image(str(img_path), x=0, y=0, w=pdf.w, h=pdf.h)
-                pdf.output(str(pdf_path))
-
-                pdf_bytes = pdf_path.read_bytes()
-                logger.info("manga_pdf_created bytes=%s", len(pdf_bytes))
-
-                meta = {
-                    "source_url": url,
-                    "generated_at": int(time.time()),
-                    "models": {
-                        "blog_model": cfg.blog_model,
-                        "darija_model": cfg.darija_model,
-                        "prompts_model": cfg.prompts_model,
-                        "image_model": cfg.image_model,
-                    },
-                    "manga_page_captions": page_captions,
-                }
-                _write_text(out_dir / "meta.json", json.dumps(meta, ensure_ascii=False, indent=2))
-
-                s3_prefix = f"{today}/{slug}"
-                logger.info("running s3_upload prefix=%s", s3_prefix)
-                k1 = store.put_text(
-                    f"{s3_prefix}/source.json",
-                    (out_dir / "source.json").read_text(encoding="utf-8"),
-                    "application/json",
-                )
-                k2 = store.put_text(f"{s3_prefix}/blog_en.md", blog_en, "text/markdown; charset=utf-8")
-                k3 = store.put_text(f"{s3_prefix}/blog_darija.md", blog_darija, "text/markdown; charset=utf-8")
-                k_prompts = store.put_text(f"{s3_prefix}/manga_prompts.md", manga_prompts_raw, "text/markdown; charset=utf-8")
-                k4 = store.put_text(
-                    f"{s3_prefix}/meta.json",
-                    json.dumps(meta, ensure_ascii=False, indent=2),
-                    "application/json",
-                )
-
-                img_keys: List[str] = []
-                for i, img_bytes in enumerate(page_images, start=1):
-                    img_keys.append(store.put_bytes(f"{s3_prefix}/manga_page_{i}.png", img_bytes, "image/png"))
-
-                k_pdf = store.put_bytes(f"{s3_prefix}/manga_pages.pdf", pdf_bytes, "application/pdf")
-
-                logger.info(
-                    "s3_uploaded url=%s keys=%s",
-                    url,
-                    [k for k in [k1, k2, k3, k_prompts, k4, k_pdf, *img_keys] if k],
+        completed = db.completed_urls(conn, [c["url"] for c in candidates if c.get("url")])
+
+        # Claims are made up front and committed together; items then run concurrently
+        # and each commits its own final state.
+        claimed: List[Dict[str, Any]] = []
+        claimed_at = int(time.time())
+        with conn:
+            for item in candidates:
+                url = item.get("url")
+                if not url:
+                    continue
+                if url in completed or not db.try_claim(conn, url, item.get("title"), now=claimed_at):
+                    logger.info("skip_completed url=%s", url)
+                    continue
+                claimed.append(item)
+
+        # Article fetches are cheap and independent, so start them all now rather than
+        # behind the LLM-bound item semaphore; each item awaits its own bundle.
+        fetch_sem = asyncio.Semaphore(_HTTP_MAX_CONNECTIONS)
+
+        async def _prefetch(item: Dict[str, Any]) -> Dict[str, Any]:
+            async with fetch_sem:
+                return await _fetch_source_bundle(http, item)
+
+        source_tasks = {item["url"]: asyncio.ensure_future(_prefetch(item)) for item in claimed}
+
+        sem = asyncio.Semaphore(max(1, cfg.max_concurrency))
+        db_lock = asyncio.Lock()
+
+        async def _gated(item: Dict[str, Any]) -> Tuple[bool, Optional[LinkedinCandidate]]:
+            async with sem:
+                return await _process_item(
+                    item,
+                    cfg=cfg,
+                    http=http,
+                    ai=ai,
+                    store=store,
+                    conn=conn,
+                    base_out=base_out,
+                    today=today,
+                    near_cache=near_cache,
+                    source_task=source_tasks[item["url"]],
+                    db_lock=db_lock,
                 )
 
-                db.mark_completed(conn, url, s3_prefix)
+        # _process_item records its own failures; anything escaping it must not discard
+        # the results of the items that did finish.
+        results = await asyncio.gather(*[_gated(item) for item in claimed], return_exceptions=True)
+        for item, res in zip(claimed, results):
+            if isinstance(res, BaseException):
+                logger.error("process_crashed url=%s error=%r", item.get("url"), res)
+                continue
+            done, linkedin_candidate = res
+            if done:
                 processed += 1
-                logger.info("process_done url=%s elapsed_s=%.3f", url, time.monotonic() - item_t0)
-
-            except Exception as e:
-                db.mark_failed(conn, url, str(e))
-                logger.exception("process_failed url=%s", url)
+            if linkedin_candidate is not None:
+                linkedin_candidates.append(linkedin_candidate)
 
         logger.info(
             "linkedin_status enable=%s dry_run=%s force=%s model=%s base_url_set=%s",
@@ -327,29 +636,31 @@ async def run_once() -> int:
         if cfg.linkedin_enable:
             li_dir = base_out / "_linkedin"
             li_json_path = li_dir / "linkedin_draft.json"
-            logger.info("linkedin_paths dir=%s draft_json=%s", str(li_dir), str(li_json_path))
+            li_prefix = f"{today}/_linkedin"
+            logger.info("linkedin_paths dir=%s draft_json=%s", li_dir, li_json_path)
+
+            # Without local copies the S3 upload is the only record of an earlier draft.
+            if cfg.write_local:
+                draft_exists = li_json_path.exists()
+            else:
+                try:
+                    draft_exists = await asyncio.to_thread(store.exists, f"{li_prefix}/linkedin_draft.json")
+                except Exception:
+                    logger.exception("linkedin_draft_exists_check_failed")
+                    draft_exists = True
 
-            if li_json_path.exists() and not cfg.linkedin_force:
-                logger.info("skip_linkedin_draft reason=already_exists path=%s", str(li_json_path))
+            if draft_exists and not cfg.linkedin_force:
+                logger.info("skip_linkedin_draft reason=already_exists path=%s", li_json_path)
             elif not linkedin_candidates:
                 logger.info("skip_linkedin_draft reason=no_candidates")
             else:
                 try:
-                    if li_json_path.exists() and cfg.linkedin_force:
-                        logger.warning("linkedin_force_regenerate enabled path=%s", str(li_json_path))
+                    if draft_exists and cfg.linkedin_force:
+                        logger.warning("linkedin_force_regenerate enabled path=%s", li_json_path)
 
                     logger.info("running linkedin_pick_best model=%s candidates=%s", cfg.linkedin_model, len(linkedin_candidates))
 
-                    ai_candidates = [
-                        {
-                            "title": c.get("title"),
-                            "source_url": c.get("source_url"),
-                            "blog_url": c.get("blog_url"),
-                            "summary": c.get("summary"),
-                            "tags": c.get("tags"),
-                        }
-                        for c in linkedin_candidates
-                    ]
+                    ai_candidates = [c.for_ai() for c in linkedin_candidates]
 
                     pick = await ai.pick_best_article_for_linkedin(cfg.linkedin_model, ai_candidates)
                     try:
@@ -360,9 +671,8 @@ async def run_once() -> int:
                         selected_index = 0
                     selected = linkedin_candidates[selected_index]
 
-                    sel_dir = Path(str(selected.get("out_dir")))
-                    blog_darija_full = (sel_dir / "blog_darija.md").read_text(encoding="utf-8")
-                    blog_en_full = (sel_dir / "blog_en.md").read_text(encoding="utf-8")
+                    blog_darija_full = selected.blog_darija
+                    blog_en_full = selected.blog_en
 
                     logger.info("running linkedin_pick_template model=%s", cfg.linkedin_model)
                     template_pick = await ai.pick_linkedin_template(cfg.linkedin_model, blog_darija_full, LINKEDIN_TEMPLATES_TEXT)
@@ -380,30 +690,31 @@ async def run_once() -> int:
                         blog_en=blog_en_full,
                         template_number=template_number,
                         templates_text=LINKEDIN_TEMPLATES_TEXT,
-                        link_url=str(selected.get("blog_url") or selected.get("source_url") or ""),
+                        link_url=selected.blog_url or selected.source_url,
                         brand=cfg.linkedin_brand,
                     )
 
                     post_text = str(draft.get("post_text") or "").strip()
                     first_comment = str(draft.get("first_comment") or "").strip()
                     if not first_comment:
-                        link_url = str(selected.get("blog_url") or selected.get("source_url") or "").strip()
+                        link_url = (selected.blog_url or selected.source_url).strip()
                         first_comment = f"{link_url}\n{cfg.linkedin_brand}".strip()
 
                     hashtags = draft.get("hashtags")
                     if not isinstance(hashtags, list):
                         hashtags = []
 
-                    li_dir.mkdir(parents=True, exist_ok=True)
+                    if cfg.write_local:
+                        li_dir.mkdir(parents=True, exist_ok=True)
                     out_json = {
                         "dry_run": bool(cfg.linkedin_dry_run),
                         "generated_at": int(time.time()),
                         "selected_index": selected_index,
                         "selected": {
-                            "title": selected.get("title"),
-                            "source_url": selected.get("source_url"),
-                            "blog_url": selected.get("blog_url"),
-                            "slug": selected.get("slug"),
+                            "title": selected.title,
+                            "source_url": selected.source_url,
+                            "blog_url": selected.blog_url,
+                            "slug": selected.slug,
                         },
                         "selection": pick,
                         "template": template_pick,
@@ -415,8 +726,7 @@ async def run_once() -> int:
                         },
                     }
 
-                    _write_text(li_dir / "linkedin_templates.md", LINKEDIN_TEMPLATES_TEXT)
-                    _write_text(li_dir / "linkedin_draft.json", json.dumps(out_json, ensure_ascii=False, indent=2))
+                    out_json_bytes = _dumps_pretty(out_json)
 
                     md = post_text
                     if hashtags:
@@ -424,23 +734,22 @@ async def run_once() -> int:
                             [f"#{h.lstrip('#').strip()}" for h in hashtags if isinstance(h, str) and h.strip()]
                         )
                     md = md + "\n\n---\n\nFIRST COMMENT:\n" + first_comment + "\n"
-                    _write_text(li_dir / "linkedin_draft.md", md)
 
-                    li_prefix = f"{today}/_linkedin"
-                    store.put_text(
-                        f"{li_prefix}/linkedin_templates.md",
-                        LINKEDIN_TEMPLATES_TEXT,
-                        "text/markdown; charset=utf-8",
-                    )
-                    store.put_text(
-                        f"{li_prefix}/linkedin_draft.json",
-                        json.dumps(out_json, ensure_ascii=False, indent=2),
-                        "application/json",
-                    )
-                    store.put_text(
-                        f"{li_prefix}/linkedin_draft.md",
-                        md,
-                        "text/markdown; charset=utf-8",
+                    await asyncio.gather(
+                        _save(cfg.write_local, li_dir / "linkedin_templates.md", LINKEDIN_TEMPLATES_BYTES),
+                        _save(cfg.write_local, li_dir / "linkedin_draft.json", out_json_bytes),
+                        _save(cfg.write_local, li_dir / "linkedin_draft.md", md),
+                        store.put_bytes_async(
+                            f"{li_prefix}/linkedin_templates.md",
+                            LINKEDIN_TEMPLATES_BYTES,
+                            "text/markdown; charset=utf-8",
+                        ),
+                        store.put_bytes_async(f"{li_prefix}/linkedin_draft.json", out_json_bytes, "application/json"),
+                        store.put_text_async(
+                            f"{li_prefix}/linkedin_draft.md",
+                            md,
+                            "text/markdown; charset=utf-8",
+                        ),
                     )
                     logger.info("linkedin_draft_done dry_run=%s", cfg.linkedin_dry_run)
                 except Exception:
@@ -452,7 +761,11 @@ async def run_once() -> int:
     finally:
         await http.aclose()
         await ai.close()
-        conn.close()
+        if ai_cache is not None:
+            ai_cache.close()
+        if near_cache is not None:
+            near_cache.close()
+        db.close(conn)
 
 
 if __name__ == "__main__":
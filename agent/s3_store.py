@@ -1,13 +1,48 @@
-from typing import Optional
+import asyncio
+import functools
+import io
+from typing import BinaryIO, Optional, Union
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import ClientError
+
+_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=_MULTIPART_THRESHOLD,
+    multipart_chunksize=_MULTIPART_THRESHOLD,
+    max_concurrency=4,
+    use_threads=True,
+)
+
+
+# boto3 clients are thread-safe and expensive to build (service model loading), so one
+# is shared per pool size across S3Store instances and warm Lambda invocations.
+@functools.lru_cache(maxsize=None)
+def _shared_client(max_pool_connections: int):
+    return boto3.client(
+        "s3",
+        config=BotoConfig(
+            max_pool_connections=max_pool_connections,
+            retries={"max_attempts": 5, "mode": "adaptive"},
+            tcp_keepalive=True,
+        ),
+    )
 
 
 class S3Store:
-    def __init__(self, bucket: str, prefix: str) -> None:
+    def __init__(self, bucket: str, prefix: str, max_concurrency: int = 8) -> None:
         self._bucket = bucket
         self._prefix = prefix.strip("/")
-        self._s3 = boto3.client("s3")
+        slots = max(1, max_concurrency)
+        # Every concurrent upload may be a multipart one with its own part workers, so the
+        # pool covers slots x part concurrency; adaptive retries back off client-side when
+        # S3 starts throttling.
+        self._s3 = _shared_client(max(16, slots * _TRANSFER_CONFIG.max_concurrency))
+        # Gate on the event loop, before a worker thread is taken, so queued uploads do not
+        # tie up the default executor that file writes, PDF builds and DB writes share.
+        self._slots = asyncio.Semaphore(slots)
 
     def _key(self, rel: str) -> str:
         rel = rel.lstrip("/")
@@ -15,6 +50,15 @@ class S3Store:
             return rel
         return f"{self._prefix}/{rel}"
 
+    def exists(self, rel_key: str) -> bool:
+        try:
+            self._s3.head_object(Bucket=self._bucket, Key=self._key(rel_key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
     def put_text(self, rel_key: str, content: str, content_type: str) -> str:
         key = self._key(rel_key)
         self._s3.put_object(
@@ -25,16 +69,39 @@ class S3Store:
         )
         return key
 
-    def put_bytes(self, rel_key: str, content: bytes, content_type: str) -> str:
+    def put_bytes(self, rel_key: str, content: Union[bytes, bytearray, BinaryIO], content_type: str) -> str:
         key = self._key(rel_key)
-        self._s3.put_object(
-            Bucket=self._bucket,
-            Key=key,
-            Body=content,
-            ContentType=content_type,
+        if isinstance(content, (bytes, bytearray)) and len(content) < _MULTIPART_THRESHOLD:
+            # Small bodies go out as one PutObject without the transfer manager's thread pool.
+            self._s3.put_object(
+                Bucket=self._bucket,
+                Key=key,
+                Body=content,
+                ContentType=content_type,
+            )
+            return key
+
+        # Large or streamed bodies use multipart, so parts upload in parallel and retry individually.
+        fileobj = io.BytesIO(content) if isinstance(content, (bytes, bytearray)) else content
+        self._s3.upload_fileobj(
+            fileobj,
+            self._bucket,
+            key,
+            ExtraArgs={"ContentType": content_type},
+            Config=_TRANSFER_CONFIG,
         )
         return key
 
+    async def put_text_async(self, rel_key: str, content: str, content_type: str) -> str:
+        async with self._slots:
+            return await asyncio.to_thread(self.put_text, rel_key, content, content_type)
+
+    async def put_bytes_async(
+        self, rel_key: str, content: Union[bytes, bytearray, BinaryIO], content_type: str
+    ) -> str:
+        async with self._slots:
+            return await asyncio.to_thread(self.put_bytes, rel_key, content, content_type)
+
     def public_url(self, key: str, region: Optional[str] = None) -> str:
         if region:
             return f"https://{self._bucket}.s3.{region}.amazonaws.com/{key}"
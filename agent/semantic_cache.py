@@ -0,0 +1,146 @@
+import hashlib
+import heapq
+import math
+import re
+import sqlite3
+import struct
+import threading
+import time
+from typing import Optional
+
+# Bottom-k MinHash over word shingles: a stdlib stand-in for embedding similarity that
+# is good at what we need here, spotting re-posted or lightly edited copies of a story.
+_SHINGLE_WORDS = 5
+_SKETCH_SIZE = 128
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_HASH = struct.Struct("<Q")
+# The same 8 bytes read as signed, which is what fits in an SQLite INTEGER column.
+_SIGNED = struct.Struct("<q")
+
+
+def _shingle_hashes(text: str) -> set:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < _SHINGLE_WORDS:
+        words = words + [""] * (_SHINGLE_WORDS - len(words))
+    out = set()
+    for i in range(len(words) - _SHINGLE_WORDS + 1):
+        shingle = " ".join(words[i : i + _SHINGLE_WORDS]).encode("utf-8")
+        out.add(_HASH.unpack(hashlib.blake2b(shingle, digest_size=8).digest())[0])
+    return out
+
+
+def sketch(text: str) -> bytes:
+    smallest = heapq.nsmallest(_SKETCH_SIZE, _shingle_hashes(text))
+    return b"".join(_HASH.pack(h) for h in smallest)
+
+
+def _unpack(blob: bytes) -> set:
+    return {h for (h,) in _HASH.iter_unpack(blob)}
+
+
+def similarity(a: bytes, b: bytes) -> float:
+    # Estimated Jaccard similarity of the two shingle sets from their bottom-k sketches.
+    sa, sb = _unpack(a), _unpack(b)
+    union_k = heapq.nsmallest(_SKETCH_SIZE, sa | sb)
+    if not union_k:
+        return 0.0
+    shared = sum(1 for h in union_k if h in sa and h in sb)
+    return shared / len(union_k)
+
+
+class NearDuplicateCache:
+    # Remembers which articles were already written up and spots near-copies of them.
+    # Every sketch hash is indexed, so find() only scores entries that share enough
+    # hashes with the probe to possibly reach the threshold instead of scanning them all.
+    # Calls are synchronous and serialized; run them via asyncio.to_thread.
+    def __init__(self, path: str, ttl_seconds: int, threshold: float) -> None:
+        self._ttl_seconds = ttl_seconds
+        self._threshold = threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS near_duplicate_sketches (
+                source_url TEXT PRIMARY KEY,
+                sketch BLOB NOT NULL,
+                expires_at INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS near_duplicate_hashes (
+                h INTEGER NOT NULL,
+                source_url TEXT NOT NULL,
+                PRIMARY KEY (h, source_url)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS near_duplicate_hashes_url ON near_duplicate_hashes (source_url)"
+        )
+        self._conn.commit()
+
+    def find(self, text: str) -> Optional[str]:
+        # Returns the source_url of the closest live entry at or above the threshold.
+        if not text.strip():
+            return None
+        probe = sketch(text)
+        hashes = [h for (h,) in _SIGNED.iter_unpack(probe)]
+        # Shared hashes in the two sketches bound the estimate from above, so entries
+        # with fewer than threshold * len(probe) of them can never match.
+        min_shared = max(1, math.ceil(self._threshold * len(hashes)))
+        placeholders = ",".join("?" * len(hashes))
+        best: Optional[str] = None
+        best_score = self._threshold
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT s.source_url, s.sketch
+                FROM near_duplicate_sketches AS s
+                JOIN (
+                    SELECT source_url FROM near_duplicate_hashes
+                    WHERE h IN ({placeholders})
+                    GROUP BY source_url
+                    HAVING COUNT(*) >= ?
+                ) AS c ON c.source_url = s.source_url
+                WHERE s.expires_at > ?
+                """,
+                (*hashes, min_shared, int(time.time())),
+            ).fetchall()
+        for source_url, blob in rows:
+            score = similarity(probe, blob)
+            if score >= best_score:
+                best, best_score = source_url, score
+        return best
+
+    def add(self, source_url: str, text: str) -> None:
+        if not text.strip():
+            return
+        blob = sketch(text)
+        now = int(time.time())
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                DELETE FROM near_duplicate_hashes WHERE source_url IN (
+                    SELECT source_url FROM near_duplicate_sketches WHERE expires_at <= ? OR source_url = ?
+                )
+                """,
+                (now, source_url),
+            )
+            self._conn.execute(
+                "DELETE FROM near_duplicate_sketches WHERE expires_at <= ? OR source_url = ?", (now, source_url)
+            )
+            self._conn.execute(
+                "INSERT INTO near_duplicate_sketches (source_url, sketch, expires_at) VALUES (?, ?, ?)",
+                (source_url, blob, now + self._ttl_seconds),
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO near_duplicate_hashes (h, source_url) VALUES (?, ?)",
+                [(h, source_url) for (h,) in _SIGNED.iter_unpack(blob)],
+            )
+
+    def close(self) -> None:
+        self._conn.close()
@@ -1,15 +1,25 @@
+import asyncio
 import re
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List
 
 import httpx
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
 HN_LISTING_URL = "https://thehackernews.com/"
 
+# Real articles are well under 1 MB; anything past this is not worth buffering.
+MAX_ARTICLE_BYTES = 4 * 1024 * 1024
+
+# Listing pages only need the post cards; skip building the rest of the DOM.
+_LISTING_STRAINER = SoupStrainer("div", class_="body-post clear")
+_DATE_RE = re.compile(r"([A-Za-z]{3}\s+\d{1,2},\s+\d{4})")
+_ARTICLEBODY_RE = re.compile(r"articlebody", re.I)
+_POSTBODY_RE = re.compile(r"post-body|entry-content", re.I)
+
 
 def _extract_date(raw: str) -> str:
     text = (raw or "").strip()
-    match = re.search(r"([A-Za-z]{3}\s+\d{1,2},\s+\d{4})", text)
+    match = _DATE_RE.search(text)
     return match.group(1) if match else text
 
 
@@ -19,32 +29,56 @@ async def fetch_listing_html(client: httpx.AsyncClient) -> str:
     return r.text
 
 
+_CARD_TAGS = ["a", "h2", "img", "span", "div"]
+_CARD_CLASSES = {("h2", "home-title"), ("span", "h-datetime"), ("span", "h-tags"), ("div", "home-desc")}
+
+
+def _scan_card(article: Any) -> Dict[str, Any]:
+    # One walk over a listing card, keeping the first match for each field the way
+    # separate find() calls would: keys are "a" (with href), "img", or the class name.
+    found: Dict[str, Any] = {}
+    for tag in article.find_all(_CARD_TAGS):
+        name = tag.name
+        if name == "a":
+            if "a" not in found and tag.has_attr("href"):
+                found["a"] = tag
+            continue
+        if name == "img":
+            found.setdefault("img", tag)
+            continue
+        for cls in tag.get("class") or ():
+            if (name, cls) in _CARD_CLASSES:
+                found.setdefault(cls, tag)
+    return found
+
+
 def parse_listing(html: str) -> List[Dict[str, Any]]:
-    soup = BeautifulSoup(html, "html.parser")
+    soup = BeautifulSoup(html, "html.parser", parse_only=_LISTING_STRAINER)
     articles = soup.find_all("div", class_="body-post clear")
     out: List[Dict[str, Any]] = []
 
     for article in articles:
-        title_el = article.find("h2", class_="home-title")
+        card = _scan_card(article)
+        title_el = card.get("home-title")
         if not title_el:
             continue
         title = title_el.get_text(strip=True)
 
-        link_el = title_el.find_parent("a", href=True) or article.find("a", href=True)
+        link_el = title_el.find_parent("a", href=True) or card.get("a")
         url = link_el["href"] if link_el else None
 
-        img_el = article.find("img")
+        img_el = card.get("img")
         image = None
         if img_el:
             image = img_el.get("data-src") or img_el.get("src")
 
-        date_el = article.find("span", class_="h-datetime")
+        date_el = card.get("h-datetime")
         date_string = _extract_date(date_el.get_text(" ", strip=True) if date_el else "")
 
-        tags_el = article.find("span", class_="h-tags")
+        tags_el = card.get("h-tags")
         tags = tags_el.get_text(" ", strip=True) if tags_el else None
 
-        desc_el = article.find("div", class_="home-desc")
+        desc_el = card.get("home-desc")
         description = desc_el.get_text(" ", strip=True) if desc_el else None
 
         if not url:
@@ -64,10 +98,32 @@ def parse_listing(html: str) -> List[Dict[str, Any]]:
     return out
 
 
-async def fetch_article_html(client: httpx.AsyncClient, url: str) -> str:
-    r = await client.get(url)
-    r.raise_for_status()
-    return r.text
+def _dedupe(values: List[str]) -> List[str]:
+    # Order-preserving; dict.fromkeys keeps the first occurrence.
+    return list(dict.fromkeys(filter(None, values)))
+
+
+async def fetch_article(client: httpx.AsyncClient, url: str) -> Dict[str, Any]:
+    # Streams the body with a size cap; decoding matches response.text (declared
+    # charset, else utf-8) and happens with the parse in a worker thread.
+    async with client.stream("GET", url) as r:
+        r.raise_for_status()
+        encoding = r.encoding or "utf-8"
+        buf = bytearray()
+        async for chunk in r.aiter_bytes(65536):
+            buf += chunk
+            if len(buf) > MAX_ARTICLE_BYTES:
+                raise RuntimeError(f"Article too large (> {MAX_ARTICLE_BYTES} bytes): {url}")
+    # Parsing is pure-Python CPU work; keep it off the event loop so other items' I/O proceeds.
+    return await asyncio.to_thread(_decode_and_parse_article, bytes(buf), url, encoding)
+
+
+def _decode_and_parse_article(raw: bytes, url: str, encoding: str) -> Dict[str, Any]:
+    try:
+        html = raw.decode(encoding, errors="replace")
+    except LookupError:
+        html = raw.decode("utf-8", errors="replace")
+    return parse_article(html, url)
 
 
 def parse_article(html: str, url: str) -> Dict[str, Any]:
@@ -77,9 +133,9 @@ def parse_article(html: str, url: str) -> Dict[str, Any]:
     title = title_el.get_text(" ", strip=True) if title_el else None
 
     content_el = (
-        soup.find("div", id=re.compile(r"articlebody", re.I))
-        or soup.find("div", class_=re.compile(r"articlebody", re.I))
-        or soup.find("div", class_=re.compile(r"post-body|entry-content", re.I))
+        soup.find("div", id=_ARTICLEBODY_RE)
+        or soup.find("div", class_=_ARTICLEBODY_RE)
+        or soup.find("div", class_=_POSTBODY_RE)
         or soup.find("article")
     )
 
@@ -89,22 +145,16 @@ def parse_article(html: str, url: str) -> Dict[str, Any]:
     images: List[str] = []
     links: List[str] = []
     if content_el:
-        for img in content_el.find_all("img"):
-            src = img.get("data-src") or img.get("src")
-            if src:
-                images.append(src)
-        for a in content_el.find_all("a", href=True):
-            links.append(a.get("href"))
-
-    def _dedupe(values: List[str]) -> List[str]:
-        seen: set[str] = set()
-        out: List[str] = []
-        for v in values:
-            if not v or v in seen:
-                continue
-            seen.add(v)
-            out.append(v)
-        return out
+        # One walk over the body collects both images and links.
+        for tag in content_el.find_all(["img", "a"]):
+            if tag.name == "img":
+                src = tag.get("data-src") or tag.get("src")
+                if src:
+                    images.append(src)
+            else:
+                href = tag.get("href")
+                if href:
+                    links.append(href)
 
     return {
         "url": url,
@@ -1,70 +1,224 @@
+import base64
+import functools
 import json
 import os
 import re
+import ssl
+import threading
 import time
 import gzip
-import urllib.request
-from urllib.parse import urljoin, urlparse
+import http.client
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse, urlsplit
+from urllib.request import getproxies, proxy_bypass
 from typing import Any, Dict, List, Optional, Tuple
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
 API_KEY = os.environ.get("API_KEY", "CHANGE_ME")
 HN_URL = "https://thehackernews.com/search/label/hacking%20news"
 HN_BASE_URL = "https://thehackernews.com"
 
+# Listing pages only need the post cards; skip building the rest of the DOM.
+_LISTING_STRAINER = SoupStrainer("div", class_="body-post clear")
+_DATE_RE = re.compile(r"([A-Za-z]{3}\s+\d{1,2},\s+\d{4})")
+_ARTICLEBODY_RE = re.compile(r"articlebody", re.I)
+_POSTBODY_RE = re.compile(r"post-body|entry-content", re.I)
+
 CACHE_TTL_SECONDS = int(os.environ.get("CACHE_TTL_SECONDS", "10"))
 MAX_STALE_SECONDS = int(os.environ.get("MAX_STALE_SECONDS", "300"))
 CONTENT_CACHE_TTL_SECONDS = int(os.environ.get("CONTENT_CACHE_TTL_SECONDS", "60"))
-
-_opener: Optional[urllib.request.OpenerDirector] = None
+CONTENT_CACHE_MAX_ENTRIES = int(os.environ.get("CONTENT_CACHE_MAX_ENTRIES", "64"))
+FETCH_TIMEOUT_SECONDS = 7
+MAX_BODY_BYTES = int(os.environ.get("MAX_BODY_BYTES", str(4 * 1024 * 1024)))
+GZIP_MIN_BYTES = int(os.environ.get("GZIP_MIN_BYTES", "512"))
+
+# Idle keep-alive connections per (scheme, host, port), reused across warm invocations
+# so repeat fetches skip the TCP and TLS handshakes.
+_MAX_IDLE_PER_HOST = 4
+_MAX_REDIRECTS = 5
+_FETCH_HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Encoding": "gzip",
+}
+_idle_conns: Dict[Tuple[str, str, int], List[http.client.HTTPConnection]] = {}
+_idle_lock = threading.Lock()
 _cache_ts: float = 0.0
+_cache_started: float = 0.0
 _cache_items: List[Dict[str, Any]] = []
 
-_content_cache_ts: Dict[str, float] = {}
-_content_cache_json: Dict[str, Dict[str, Any]] = {}
-_content_cache_html: Dict[str, str] = {}
-
-
-def _get_opener() -> urllib.request.OpenerDirector:
-    global _opener
-    if _opener is None:
-        _opener = urllib.request.build_opener()
-    return _opener
+# url -> (fetched_at, gzip-compressed raw HTML, parsed article), least recently used first.
+# Raw HTML is only needed for format=html&raw=true, so it is kept compressed.
+_content_cache: "OrderedDict[str, Tuple[float, bytes, Dict[str, Any]]]" = OrderedDict()
+_content_cache_lock = threading.Lock()
+
+# Single-flight refreshes: one upstream fetch per resource at a time, with callers
+# inside MAX_STALE_SECONDS served the old listing while it revalidates. Lambda freezes
+# the container between invocations, so a background refresh may sit frozen with a dead
+# socket; callers only join one that is younger than FETCH_TIMEOUT_SECONDS.
+_refresh_pool = ThreadPoolExecutor(max_workers=2)
+_news_lock = threading.Lock()
+_news_refresh: Optional[Future] = None
+_news_refresh_started: float = 0.0
+# Article fetches are serialized per URL through a fixed stripe of locks, so ids sent
+# by clients cannot grow this without bound.
+_ARTICLE_LOCK_STRIPES = 64
+_article_locks = [threading.Lock() for _ in range(_ARTICLE_LOCK_STRIPES)]
+
+
+def _checkout_conn(key: Tuple[str, str, int], timeout_seconds: int) -> Tuple[http.client.HTTPConnection, bool]:
+    # Returns (connection, reused).
+    with _idle_lock:
+        idle = _idle_conns.get(key)
+        conn = idle.pop() if idle else None
+    if conn is not None:
+        conn.timeout = timeout_seconds
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout_seconds)
+        return conn, True
+    return _new_conn(key, timeout_seconds), False
+
+
+@functools.lru_cache(maxsize=1)
+def _proxies() -> Dict[str, str]:
+    # HTTP_PROXY/HTTPS_PROXY/NO_PROXY, read once the way urllib did.
+    return getproxies()
+
+
+def _proxy_for(scheme: str, host: str) -> Optional[Tuple[str, int]]:
+    proxy = _proxies().get(scheme)
+    if not proxy or proxy_bypass(host):
+        return None
+    parts = urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+    return parts.hostname or "", parts.port or 80
+
+
+def _new_conn(key: Tuple[str, str, int], timeout_seconds: int) -> http.client.HTTPConnection:
+    scheme, host, port = key
+    cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+    proxy = _proxy_for(scheme, host)
+    if proxy is None:
+        return cls(host, port, timeout=timeout_seconds)
+    # HTTPS goes through a CONNECT tunnel; plain HTTP sends absolute URLs to the proxy.
+    conn = cls(proxy[0], proxy[1], timeout=timeout_seconds)
+    if scheme == "https":
+        conn.set_tunnel(host, port)
+    return conn
+
+
+def _release_conn(key: Tuple[str, str, int], conn: http.client.HTTPConnection, resp: http.client.HTTPResponse) -> None:
+    if resp.will_close:
+        conn.close()
+        return
+    with _idle_lock:
+        idle = _idle_conns.setdefault(key, [])
+        if len(idle) < _MAX_IDLE_PER_HOST:
+            idle.append(conn)
+            return
+    conn.close()
+
+
+# What a server closing an idle keep-alive connection looks like, over plain TCP or TLS;
+# timeouts are not retried, since a second attempt would wait the full timeout again.
+_STALE_CONN_ERRORS = (
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    ssl.SSLEOFError,
+)
+
+
+def _request(url: str, timeout_seconds: int) -> Tuple[Tuple[str, str, int], http.client.HTTPConnection, http.client.HTTPResponse]:
+    parts = urlsplit(url)
+    scheme = (parts.scheme or "https").lower()
+    if scheme not in ("http", "https"):
+        raise ValueError(f"Unsupported URL scheme: {scheme}")
+    key = (scheme, parts.hostname or "", parts.port or (443 if scheme == "https" else 80))
+    target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    if scheme == "http" and _proxy_for(scheme, key[1]) is not None:
+        target = f"http://{parts.netloc}{target}"
+
+    conn, reused = _checkout_conn(key, timeout_seconds)
+    try:
+        conn.request("GET", target, headers=_FETCH_HEADERS)
+        return key, conn, conn.getresponse()
+    except _STALE_CONN_ERRORS:
+        conn.close()
+        if not reused:
+            raise
+    except BaseException:
+        conn.close()
+        raise
+    # The server dropped an idle keep-alive connection; retry once on a fresh one.
+    conn = _new_conn(key, timeout_seconds)
+    try:
+        conn.request("GET", target, headers=_FETCH_HEADERS)
+        return key, conn, conn.getresponse()
+    except BaseException:
+        conn.close()
+        raise
 
 
 def _extract_date(raw: str) -> str:
     text = (raw or "").strip()
-    match = re.search(r"([A-Za-z]{3}\s+\d{1,2},\s+\d{4})", text)
+    match = _DATE_RE.search(text)
     return match.group(1) if match else text
 
 
+_CARD_TAGS = ["a", "h2", "img", "span", "div"]
+_CARD_CLASSES = {("h2", "home-title"), ("span", "h-datetime"), ("span", "h-tags"), ("div", "home-desc")}
+
+
+def _scan_card(article: Any) -> Dict[str, Any]:
+    # One walk over a listing card, keeping the first match for each field the way
+    # separate find() calls would: keys are "a" (with href), "img", or the class name.
+    found: Dict[str, Any] = {}
+    for tag in article.find_all(_CARD_TAGS):
+        name = tag.name
+        if name == "a":
+            if "a" not in found and tag.has_attr("href"):
+                found["a"] = tag
+            continue
+        if name == "img":
+            found.setdefault("img", tag)
+            continue
+        for cls in tag.get("class") or ():
+            if (name, cls) in _CARD_CLASSES:
+                found.setdefault(cls, tag)
+    return found
+
+
 def _parse_news(html: str) -> List[Dict[str, Any]]:
-    soup = BeautifulSoup(html, "html.parser")
+    soup = BeautifulSoup(html, "html.parser", parse_only=_LISTING_STRAINER)
     articles = soup.find_all("div", class_="body-post clear")
     news_list: List[Dict[str, Any]] = []
 
     for article in articles:
-        title_el = article.find("h2", class_="home-title")
+        card = _scan_card(article)
+        title_el = card.get("home-title")
         if not title_el:
             continue
         title = title_el.get_text(strip=True)
 
-        link_el = title_el.find_parent("a", href=True) or article.find("a", href=True)
+        link_el = title_el.find_parent("a", href=True) or card.get("a")
         url = link_el["href"] if link_el else None
 
-        img_el = article.find("img")
+        img_el = card.get("img")
         image = None
         if img_el:
             image = img_el.get("data-src") or img_el.get("src")
 
-        date_el = article.find("span", class_="h-datetime")
+        date_el = card.get("h-datetime")
         date_string = _extract_date(date_el.get_text(" ", strip=True) if date_el else "")
 
-        tags_el = article.find("span", class_="h-tags")
+        tags_el = card.get("h-tags")
         tags = tags_el.get_text(" ", strip=True) if tags_el else None
 
-        desc_el = article.find("div", class_="home-desc")
+        desc_el = card.get("home-desc")
         description = desc_el.get_text(" ", strip=True) if desc_el else None
 
         news_list.append(
@@ -81,32 +235,55 @@ def _parse_news(html: str) -> List[Dict[str, Any]]:
     return news_list
 
 
-def _fetch_text(url: str, timeout_seconds: int = 7) -> str:
-    opener = _get_opener()
-    req = urllib.request.Request(
-        url,
-        headers={
-            "User-Agent": "Mozilla/5.0",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-            "Accept-Encoding": "gzip",
-        },
-        method="GET",
-    )
-
-    with opener.open(req, timeout=timeout_seconds) as resp:
-        status = getattr(resp, "status", None) or 200
-        if status < 200 or status >= 300:
-            raise RuntimeError(f"HTTP {status}")
-
-        data = resp.read()
-        encoding = (resp.headers.get("Content-Encoding") or "").lower()
-        if "gzip" in encoding:
-            data = gzip.decompress(data)
-
-        charset = resp.headers.get_content_charset() or "utf-8"
-        return data.decode(charset, errors="replace")
-
-
+def _read_capped(resp: http.client.HTTPResponse) -> bytes:
+    # Read in chunks and give up past MAX_BODY_BYTES, both on the wire and after
+    # decompression, so an oversized or hostile page cannot exhaust memory.
+    buf = bytearray()
+    while True:
+        chunk = resp.read(65536)
+        if not chunk:
+            break
+        buf += chunk
+        if len(buf) > MAX_BODY_BYTES:
+            raise RuntimeError("Response too large")
+
+    data = bytes(buf)
+    encoding = (resp.headers.get("Content-Encoding") or "").lower()
+    if "gzip" in encoding:
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        data = inflater.decompress(data, MAX_BODY_BYTES + 1)
+        if len(data) > MAX_BODY_BYTES:
+            raise RuntimeError("Response too large")
+    return data
+
+
+def _fetch_text(url: str, timeout_seconds: int = FETCH_TIMEOUT_SECONDS) -> str:
+    for _ in range(_MAX_REDIRECTS + 1):
+        key, conn, resp = _request(url, timeout_seconds)
+        released = False
+        try:
+            status = resp.status
+            location = resp.getheader("Location")
+            # Bodies are always read in full (and capped) so the connection can be reused.
+            data = _read_capped(resp)
+            _release_conn(key, conn, resp)
+            released = True
+            if 300 <= status < 400 and location:
+                url = urljoin(url, location)
+                continue
+            if status < 200 or status >= 300:
+                raise RuntimeError(f"HTTP {status}")
+            charset = resp.headers.get_content_charset() or "utf-8"
+            return data.decode(charset, errors="replace")
+        finally:
+            # Oversized, undecodable or failed reads leave the socket in an unknown state.
+            if not released:
+                conn.close()
+    raise RuntimeError("Too many redirects")
+
+
+# Warm containers see the same ids repeatedly; invalid ids raise and are not cached.
+@functools.lru_cache(maxsize=512)
 def _resolve_article_url(article_id: str) -> str:
     raw = (article_id or "").strip()
     if not raw:
@@ -129,16 +306,8 @@ def _resolve_article_url(article_id: str) -> str:
 
 
 def _dedupe_keep_order(values: List[str]) -> List[str]:
-    seen: set[str] = set()
-    out: List[str] = []
-    for v in values:
-        if not v:
-            continue
-        if v in seen:
-            continue
-        seen.add(v)
-        out.append(v)
-    return out
+    # dict.fromkeys keeps the first occurrence of each value.
+    return list(dict.fromkeys(filter(None, values)))
 
 
 def _parse_article(html: str, url: str) -> Dict[str, Any]:
@@ -148,9 +317,9 @@ def _parse_article(html: str, url: str) -> Dict[str, Any]:
     title = title_el.get_text(" ", strip=True) if title_el else None
 
     content_el = (
-        soup.find("div", id=re.compile(r"articlebody", re.I))
-        or soup.find("div", class_=re.compile(r"articlebody", re.I))
-        or soup.find("div", class_=re.compile(r"post-body|entry-content", re.I))
+        soup.find("div", id=_ARTICLEBODY_RE)
+        or soup.find("div", class_=_ARTICLEBODY_RE)
+        or soup.find("div", class_=_POSTBODY_RE)
         or soup.find("article")
     )
 
@@ -160,12 +329,16 @@ def _parse_article(html: str, url: str) -> Dict[str, Any]:
     images: List[str] = []
     links: List[str] = []
     if content_el:
-        for img in content_el.find_all("img"):
-            src = img.get("data-src") or img.get("src")
-            if src:
-                images.append(src)
-        for a in content_el.find_all("a", href=True):
-            links.append(a.get("href"))
+        # One walk over the body collects both images and links.
+        for tag in content_el.find_all(["img", "a"]):
+            if tag.name == "img":
+                src = tag.get("data-src") or tag.get("src")
+                if src:
+                    images.append(src)
+            else:
+                href = tag.get("href")
+                if href:
+                    links.append(href)
 
     images = _dedupe_keep_order(images)
     links = _dedupe_keep_order(links)
@@ -180,21 +353,32 @@ def _parse_article(html: str, url: str) -> Dict[str, Any]:
     }
 
 
-def _get_article_cached(url: str, force_refresh: bool) -> Tuple[Dict[str, Any], str]:
-    now = time.monotonic()
-    ts = _content_cache_ts.get(url, 0.0)
-    age = now - ts
+def _get_article_cached(url: str, force_refresh: bool, want_html: bool = False) -> Tuple[Dict[str, Any], str]:
+    # Returns (parsed, raw_html); raw_html is "" unless want_html.
+    requested_at = time.monotonic()
+    with _article_locks[hash(url) % _ARTICLE_LOCK_STRIPES]:
+        with _content_cache_lock:
+            entry = _content_cache.get(url)
+            if entry is not None:
+                _content_cache.move_to_end(url)
 
-    if not force_refresh and url in _content_cache_json and age <= CONTENT_CACHE_TTL_SECONDS:
-        return _content_cache_json[url], _content_cache_html.get(url, "")
+        if entry is not None:
+            ts, html_gz, parsed = entry
+            age = time.monotonic() - ts
+            # A fetch that finished while we waited on the lock satisfies a forced refresh too.
+            if ts >= requested_at or (not force_refresh and age <= CONTENT_CACHE_TTL_SECONDS):
+                return parsed, (gzip.decompress(html_gz).decode("utf-8") if want_html else "")
 
-    html = _fetch_text(url)
-    parsed = _parse_article(html, url)
+        html = _fetch_text(url)
+        parsed = _parse_article(html, url)
 
-    _content_cache_ts[url] = time.monotonic()
-    _content_cache_json[url] = parsed
-    _content_cache_html[url] = html
-    return parsed, html
+        html_gz = gzip.compress(html.encode("utf-8"), compresslevel=1)
+        with _content_cache_lock:
+            _content_cache[url] = (time.monotonic(), html_gz, parsed)
+            _content_cache.move_to_end(url)
+            while len(_content_cache) > CONTENT_CACHE_MAX_ENTRIES:
+                _content_cache.popitem(last=False)
+        return parsed, (html if want_html else "")
 
 
 def _scrape_now() -> List[Dict[str, Any]]:
@@ -202,9 +386,42 @@ def _scrape_now() -> List[Dict[str, Any]]:
     return _parse_news(html)
 
 
-def _get_cached_news(force_refresh: bool) -> List[Dict[str, Any]]:
-    global _cache_ts, _cache_items
+def _refresh_news(started: float) -> List[Dict[str, Any]]:
+    global _cache_ts, _cache_started, _cache_items
+
+    items = _scrape_now()
+    with _news_lock:
+        # A refresh that was abandoned and finished late must not replace newer data.
+        if started >= _cache_started:
+            _cache_items = items
+            _cache_ts = time.monotonic()
+            _cache_started = started
+    return items
+
+
+def _inflight_news_refresh() -> Optional[Tuple[Future, float]]:
+    # Returns (future, age) for a running refresh that is still worth waiting on.
+    # Callers hold _news_lock.
+    fut = _news_refresh
+    if fut is None or fut.done():
+        return None
+    age = time.monotonic() - _news_refresh_started
+    if age > FETCH_TIMEOUT_SECONDS:
+        return None
+    return fut, age
+
 
+def _start_news_refresh() -> None:
+    global _news_refresh, _news_refresh_started
+
+    with _news_lock:
+        if _inflight_news_refresh() is not None:
+            return
+        _news_refresh_started = time.monotonic()
+        _news_refresh = _refresh_pool.submit(_refresh_news, _news_refresh_started)
+
+
+def _get_cached_news(force_refresh: bool) -> List[Dict[str, Any]]:
     now = time.monotonic()
     age = now - _cache_ts
     has_cache = len(_cache_items) > 0
@@ -212,13 +429,22 @@ def _get_cached_news(force_refresh: bool) -> List[Dict[str, Any]]:
     stale_ok = has_cache and age <= MAX_STALE_SECONDS
 
     if not force_refresh:
-        if fresh or stale_ok:
+        if fresh:
+            return list(_cache_items)
+        if stale_ok:
+            _start_news_refresh()
             return list(_cache_items)
 
-    items = _scrape_now()
-    _cache_items = items
-    _cache_ts = time.monotonic()
-    return list(_cache_items)
+    with _news_lock:
+        inflight = _inflight_news_refresh()
+    if inflight is not None:
+        fut, fut_age = inflight
+        try:
+            return list(fut.result(timeout=FETCH_TIMEOUT_SECONDS - fut_age))
+        except Exception:
+            pass
+    # No usable refresh in flight (none, failed, or possibly frozen): fetch here.
+    return list(_refresh_news(time.monotonic()))
 
 
 def _normalize_headers(headers: Optional[Dict[str, str]]) -> Dict[str, str]:
@@ -270,6 +496,10 @@ def _get_method_path(event: Dict[str, Any]) -> Tuple[str, str]:
     return str(method).upper(), str(path)
 
 
+# json.dumps builds a new JSONEncoder whenever non-default options are passed; reuse one.
+_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
 def _json(status: int, payload: Any) -> Dict[str, Any]:
     return {
         "statusCode": status,
@@ -278,7 +508,7 @@ def _json(status: int, payload: Any) -> Dict[str, Any]:
             "Cache-Control": "no-store",
         },
         "isBase64Encoded": False,
-        "body": json.dumps(payload, ensure_ascii=False),
+        "body": _JSON_ENCODER.encode(payload),
     }
 
 
@@ -298,9 +528,55 @@ def _unauthorized() -> Dict[str, Any]:
     return _json(401, {"detail": "Invalid API key"})
 
 
+def _accepts_gzip(accept_encoding: str) -> bool:
+    # RFC 9110 content negotiation: gzip (or *, when gzip is not named) with q > 0.
+    star: Optional[bool] = None
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = 0.0
+        if coding in ("gzip", "x-gzip"):
+            return q > 0
+        if coding == "*":
+            star = q > 0
+    return bool(star)
+
+
+def _maybe_gzip(response: Dict[str, Any], accept_encoding: str) -> Dict[str, Any]:
+    # Compress larger bodies for clients that accept gzip; level 1 is nearly as small
+    # as the default for JSON/HTML and much cheaper on Lambda CPU. Every text response
+    # varies on Accept-Encoding, compressed or not, so shared caches keep them apart.
+    body = response.get("body")
+    if not isinstance(body, str) or response.get("isBase64Encoded"):
+        return response
+    headers = dict(response.get("headers") or {})
+    headers["Vary"] = "Accept-Encoding"
+    raw = body.encode("utf-8")
+    if len(raw) < GZIP_MIN_BYTES or not _accepts_gzip(accept_encoding):
+        return {**response, "headers": headers}
+    headers["Content-Encoding"] = "gzip"
+    return {
+        **response,
+        "headers": headers,
+        "isBase64Encoded": True,
+        "body": base64.b64encode(gzip.compress(raw, compresslevel=1)).decode("ascii"),
+    }
+
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    method, path = _get_method_path(event)
     headers = _normalize_headers(event.get("headers"))
+    return _maybe_gzip(_route(event, headers), headers.get("accept-encoding", ""))
+
+
+def _route(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+    method, path = _get_method_path(event)
     query = _parse_query(event)
 
     if method != "GET":
@@ -340,7 +616,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         raw = (query.get("raw", "false").lower() == "true")
         try:
             url = _resolve_article_url(article_id)
-            parsed, full_html = _get_article_cached(url=url, force_refresh=refresh)
+            parsed, full_html = _get_article_cached(url=url, force_refresh=refresh, want_html=(fmt == "html" and raw))
         except ValueError as e:
             return _json(400, {"detail": str(e)})
         except Exception:
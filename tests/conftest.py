@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The Lambda handler and its vendored bs4 live in package/, which is the Lambda bundle root.
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_ROOT, "package"))
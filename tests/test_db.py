@@ -0,0 +1,56 @@
+import sqlite3
+from typing import Iterator
+
+import pytest
+
+from agent import db
+
+
+@pytest.fixture
+def conn() -> Iterator[sqlite3.Connection]:
+    c = db.connect(":memory:")
+    db.init(c)
+    yield c
+    c.close()
+
+
+def _status(conn: sqlite3.Connection, url: str) -> str:
+    return conn.execute("SELECT status FROM posts WHERE source_url = ?", (url,)).fetchone()[0]
+
+
+def test_try_claim_inserts_new_url(conn: sqlite3.Connection) -> None:
+    assert db.try_claim(conn, "u", "Title", now=100)
+    row = conn.execute("SELECT source_title, status, created_at, updated_at FROM posts").fetchone()
+    assert row == ("Title", "started", 100, 100)
+
+
+def test_try_claim_reclaims_started_and_failed(conn: sqlite3.Connection) -> None:
+    assert db.try_claim(conn, "u", "Old", now=100)
+    assert db.try_claim(conn, "u", "New", now=200)
+    db.in_transaction(conn, db.mark_failed, "u", "boom", now=300)
+    assert db.try_claim(conn, "u", "New", now=400)
+    row = conn.execute("SELECT source_title, status, created_at, updated_at FROM posts").fetchone()
+    assert row == ("New", "started", 100, 400)
+
+
+@pytest.mark.parametrize("final", ["completed", "duplicate"])
+def test_try_claim_skips_terminal_rows(conn: sqlite3.Connection, final: str) -> None:
+    assert db.try_claim(conn, "u", "T", now=100)
+    if final == "completed":
+        db.in_transaction(conn, db.mark_completed, "u", "2024-01-01/t", now=200)
+    else:
+        db.in_transaction(conn, db.mark_duplicate, "u", "other", now=200)
+    assert not db.try_claim(conn, "u", "T", now=300)
+    assert _status(conn, "u") == final
+    assert conn.execute("SELECT updated_at FROM posts").fetchone()[0] == 200
+
+
+def test_completed_urls_and_post_status(conn: sqlite3.Connection) -> None:
+    for url in ("a", "b", "c"):
+        db.try_claim(conn, url, None)
+    db.in_transaction(conn, db.mark_completed, "a", "p")
+    db.in_transaction(conn, db.mark_duplicate, "b", "a")
+    assert db.completed_urls(conn, ["a", "b", "c", "d"]) == frozenset({"a", "b"})
+    assert db.completed_urls(conn, []) == frozenset()
+    assert db.post_status(conn, "c") == "started"
+    assert db.post_status(conn, "d") is None
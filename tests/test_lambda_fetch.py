@@ -0,0 +1,122 @@
+import gzip
+import http.server
+import threading
+from typing import Any, Dict, Iterator, List
+
+import pytest
+
+import lambda_native_handler as h
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    routes: Dict[str, Any] = {}
+    seen: List[Any] = []
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self.seen.append((self.client_address, self.path))
+        status, headers, body, drop = self.routes.get(self.path, (404, {}, b"missing", False))
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        # Close without a Connection: close header, like a server reaping an idle keep-alive.
+        self.close_connection = drop
+
+
+@pytest.fixture
+def server() -> Iterator[str]:
+    _Handler.routes = {}
+    _Handler.seen = []
+    srv = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    h._idle_conns.clear()
+    yield f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+    srv.server_close()
+    h._idle_conns.clear()
+
+
+@pytest.fixture(autouse=True)
+def no_proxy(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    for name in ("http_proxy", "https_proxy", "HTTP_PROXY", "HTTPS_PROXY", "no_proxy", "NO_PROXY"):
+        monkeypatch.delenv(name, raising=False)
+    h._proxies.cache_clear()
+    yield
+    h._proxies.cache_clear()
+
+
+def _connections() -> int:
+    return len({addr for addr, _ in _Handler.seen})
+
+
+def test_keep_alive_connection_is_reused(server: str) -> None:
+    _Handler.routes["/ok"] = (200, {"Content-Type": "text/html; charset=utf-8"}, "héllo".encode(), False)
+    assert h._fetch_text(server + "/ok") == "héllo"
+    assert h._fetch_text(server + "/ok") == "héllo"
+    assert _connections() == 1
+
+
+def test_gzip_body_is_decoded(server: str) -> None:
+    _Handler.routes["/gz"] = (200, {"Content-Encoding": "gzip"}, gzip.compress(b"packed"), False)
+    assert h._fetch_text(server + "/gz") == "packed"
+
+
+def test_redirects_are_followed_on_the_same_connection(server: str) -> None:
+    _Handler.routes["/old"] = (301, {"Location": "/new"}, b"moved", False)
+    _Handler.routes["/new"] = (200, {}, b"here", False)
+    assert h._fetch_text(server + "/old") == "here"
+    assert [p for _, p in _Handler.seen] == ["/old", "/new"]
+    assert _connections() == 1
+
+
+def test_redirect_loop_is_bounded(server: str) -> None:
+    _Handler.routes["/loop"] = (302, {"Location": "/loop"}, b"", False)
+    with pytest.raises(RuntimeError, match="Too many redirects"):
+        h._fetch_text(server + "/loop")
+
+
+def test_error_status_raises_and_keeps_connection(server: str) -> None:
+    with pytest.raises(RuntimeError, match="HTTP 404"):
+        h._fetch_text(server + "/nope")
+    assert sum(len(v) for v in h._idle_conns.values()) == 1
+
+
+def test_oversize_body_is_rejected_and_connection_dropped(server: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(h, "MAX_BODY_BYTES", 1024)
+    _Handler.routes["/big"] = (200, {}, b"x" * 4096, False)
+    _Handler.routes["/bomb"] = (200, {"Content-Encoding": "gzip"}, gzip.compress(b"\0" * 65536), False)
+    for path in ("/big", "/bomb"):
+        with pytest.raises(RuntimeError, match="too large"):
+            h._fetch_text(server + path)
+    assert sum(len(v) for v in h._idle_conns.values()) == 0
+
+
+def test_stale_keep_alive_is_retried_on_a_fresh_connection(server: str) -> None:
+    _Handler.routes["/drop"] = (200, {}, b"first", True)
+    assert h._fetch_text(server + "/drop") == "first"
+    _Handler.routes["/drop"] = (200, {}, b"second", False)
+    assert h._fetch_text(server + "/drop") == "second"
+    assert _connections() == 2
+
+
+def test_http_proxy_receives_absolute_url(server: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    _Handler.routes["http://example.invalid/a?b=1"] = (200, {}, b"via proxy", False)
+    monkeypatch.setenv("http_proxy", server)
+    h._proxies.cache_clear()
+    assert h._fetch_text("http://example.invalid/a?b=1") == "via proxy"
+    assert [p for _, p in _Handler.seen] == ["http://example.invalid/a?b=1"]
+
+
+def test_no_proxy_bypasses_proxy(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("https_proxy", "http://proxy.internal:3128")
+    monkeypatch.setenv("no_proxy", "thehackernews.com")
+    h._proxies.cache_clear()
+    assert h._proxy_for("https", "thehackernews.com") is None
+    assert h._proxy_for("https", "example.com") == ("proxy.internal", 3128)
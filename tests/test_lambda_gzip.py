@@ -0,0 +1,56 @@
+import base64
+import gzip
+
+import pytest
+
+import lambda_native_handler as h
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("gzip", True),
+        ("GZIP; q=0.5", True),
+        ("deflate, gzip;q=1.0", True),
+        ("x-gzip", True),
+        ("br, *", True),
+        ("gzip;q=0", False),
+        ("gzip;q=0.0, *", False),
+        ("*;q=0", False),
+        ("identity", False),
+        ("", False),
+    ],
+)
+def test_accepts_gzip(header: str, expected: bool) -> None:
+    assert h._accepts_gzip(header) is expected
+
+
+def test_large_body_is_compressed() -> None:
+    payload = {"text": "y" * 2000}
+    resp = h._maybe_gzip(h._json(200, payload), "gzip")
+    assert resp["isBase64Encoded"] is True
+    assert resp["headers"]["Content-Encoding"] == "gzip"
+    assert resp["headers"]["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(base64.b64decode(resp["body"])).decode("utf-8") == h._json(200, payload)["body"]
+
+
+@pytest.mark.parametrize("accept", ["gzip;q=0", ""])
+def test_refused_gzip_still_varies(accept: str) -> None:
+    resp = h._maybe_gzip(h._json(200, {"text": "y" * 2000}), accept)
+    assert resp["isBase64Encoded"] is False
+    assert "Content-Encoding" not in resp["headers"]
+    assert resp["headers"]["Vary"] == "Accept-Encoding"
+
+
+def test_small_body_is_not_compressed_but_varies() -> None:
+    resp = h._maybe_gzip(h._json(200, {"status": "ok"}), "gzip")
+    assert resp["isBase64Encoded"] is False
+    assert resp["body"] == '{"status":"ok"}'
+    assert resp["headers"]["Vary"] == "Accept-Encoding"
+
+
+def test_handler_health_endpoint() -> None:
+    event = {"requestContext": {"http": {"method": "GET", "path": "/health"}}, "headers": {"Accept-Encoding": "gzip"}}
+    resp = h.handler(event, None)
+    assert resp["statusCode"] == 200
+    assert resp["headers"]["Vary"] == "Accept-Encoding"
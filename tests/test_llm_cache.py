@@ -0,0 +1,46 @@
+from agent.llm_cache import ResponseCache, cache_key
+
+
+def _payload(**extra):
+    return {"model": "m", "messages": [{"role": "user", "content": "hello"}], "temperature": 0, **extra}
+
+
+def test_cache_key_is_pinned() -> None:
+    # Changing the key scheme silently invalidates every stored entry; do it on purpose.
+    assert cache_key(_payload()) == "0e40273ffff3642ad3c86ac42d3613c3392aad47967624c798b131ffdd55ef7f"
+
+
+def test_cache_key_ignores_dict_order() -> None:
+    reordered = {"temperature": 0, "messages": [{"content": "hello", "role": "user"}], "model": "m"}
+    assert cache_key(reordered) == cache_key(_payload())
+
+
+def test_cache_key_tracks_content_and_options() -> None:
+    base = cache_key(_payload())
+    assert cache_key({**_payload(), "messages": [{"role": "user", "content": "hello!"}]}) != base
+    assert cache_key({**_payload(), "messages": [{"role": "system", "content": "hello"}]}) != base
+    assert cache_key(_payload(model="other")) != base
+    assert cache_key(_payload(temperature=0.5)) != base
+
+
+def test_response_cache_roundtrip(tmp_path) -> None:
+    cache = ResponseCache(str(tmp_path / "c.db"), ttl_seconds=60)
+    try:
+        assert cache.get("k") is None
+        cache.set("k", {"choices": [{"message": {"content": "hi"}}]})
+        assert cache.get("k") == {"choices": [{"message": {"content": "hi"}}]}
+        cache.delete("k")
+        assert cache.get("k") is None
+        cache.set_image("img", b"\x89PNG", "caption")
+        assert cache.get_image("img") == (b"\x89PNG", "caption")
+    finally:
+        cache.close()
+
+
+def test_response_cache_expires(tmp_path) -> None:
+    cache = ResponseCache(str(tmp_path / "c.db"), ttl_seconds=-1)
+    try:
+        cache.set("k", {"a": 1})
+        assert cache.get("k") is None
+    finally:
+        cache.close()
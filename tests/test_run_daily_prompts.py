@@ -0,0 +1,24 @@
+from agent.run_daily import _extract_prompts_lenient, _extract_txt_codeblocks
+
+
+def test_partial_txt_fences_are_not_reparsed_leniently() -> None:
+    # Three txt fences, the first holding a numbered list: this is an incomplete reply
+    # and must go to the retry path, not be split into fragments.
+    reply = (
+        "Page 1 Prompt:\n```txt\n"
+        "1. Background: neon city\n2. Characters: hacker\n3. Objects: coins\n4. Action: running\n```\n"
+        "Page 2 Prompt:\n```txt\nA second page\n```\n"
+        "Page 3 Prompt:\n```txt\nA third page\n```\n"
+    )
+    assert len(_extract_txt_codeblocks(reply)) == 3
+    assert _extract_prompts_lenient(reply) == []
+
+
+def test_page_sections_without_fences() -> None:
+    reply = "".join(f"**Page {i}:** scene {i}\nmore detail {i}\n\n" for i in range(1, 5))
+    assert _extract_prompts_lenient(reply) == [f"scene {i}\nmore detail {i}" for i in range(1, 5)]
+
+
+def test_plain_fences() -> None:
+    reply = "".join(f"Page {i} Prompt:\n```\nscene {i}\n```\n" for i in range(1, 5))
+    assert _extract_prompts_lenient(reply) == [f"scene {i}" for i in range(1, 5)]
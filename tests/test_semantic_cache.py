@@ -0,0 +1,50 @@
+import random
+
+from agent.semantic_cache import NearDuplicateCache, similarity, sketch
+
+_WORDS = [f"w{i}" for i in range(2000)]
+
+
+def _doc(seed: int, n: int = 400) -> str:
+    rnd = random.Random(seed)
+    return " ".join(rnd.choice(_WORDS) for _ in range(n))
+
+
+def test_similarity_bounds() -> None:
+    a = sketch(_doc(1))
+    assert similarity(a, a) == 1.0
+    assert similarity(a, sketch(_doc(2))) < 0.1
+
+
+def test_find_matches_lightly_edited_copy(tmp_path) -> None:
+    cache = NearDuplicateCache(str(tmp_path / "n.db"), ttl_seconds=3600, threshold=0.5)
+    try:
+        for i in range(20):
+            cache.add(f"https://example.com/{i}", _doc(i))
+        words = _doc(7).split()
+        words[50:55] = ["edited"] * 5
+        assert cache.find(" ".join(words)) == "https://example.com/7"
+        assert cache.find(_doc(999)) is None
+        assert cache.find("   ") is None
+    finally:
+        cache.close()
+
+
+def test_add_replaces_entry_for_same_url(tmp_path) -> None:
+    cache = NearDuplicateCache(str(tmp_path / "n.db"), ttl_seconds=3600, threshold=0.5)
+    try:
+        cache.add("u", _doc(1))
+        cache.add("u", _doc(2))
+        assert cache.find(_doc(1)) is None
+        assert cache.find(_doc(2)) == "u"
+    finally:
+        cache.close()
+
+
+def test_expired_entries_are_ignored(tmp_path) -> None:
+    cache = NearDuplicateCache(str(tmp_path / "n.db"), ttl_seconds=-1, threshold=0.5)
+    try:
+        cache.add("u", _doc(1))
+        assert cache.find(_doc(1)) is None
+    finally:
+        cache.close()
@@ -0,0 +1,30 @@
+import random
+import re
+
+from agent.run_daily import _slugify
+
+_OLD_STRIP = re.compile(r"[^a-z0-9\s-]")
+_OLD_COLLAPSE = re.compile(r"[\s-]+")
+
+
+def _old_slugify(value: str) -> str:
+    # The two-regex version slugs were originally published with.
+    v = (value or "").strip().lower()
+    v = _OLD_STRIP.sub("", v)
+    v = _OLD_COLLAPSE.sub("-", v).strip("-")
+    return v or "post"
+
+
+def test_known_titles() -> None:
+    assert _slugify("Fortinet's  New -- Zero-Day!") == "fortinets-new-zero-day"
+    assert _slugify("  Ünïcödé\tand spaces  ") == "ncd-and-spaces"
+    assert _slugify("!!!") == "post"
+    assert _slugify("") == "post"
+
+
+def test_matches_former_regex_implementation() -> None:
+    rnd = random.Random(1234)
+    alphabet = "aZ09 -_\t\n  .,'!éİßçØ漢-"
+    for _ in range(5000):
+        title = "".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 40)))
+        assert _slugify(title) == _old_slugify(title), repr(title)